@@ -1,8 +1,8 @@
-import os
 from fastapi import Header, HTTPException
+from app.core.config import settings
 
 # --- 簡易APIキー保護（.env に ADMIN_API_KEY がある時だけ有効化）---
-ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "").strip()
+ADMIN_API_KEY = settings.admin_api_key
 
 def maybe_require_admin(x_api_key: str = Header(default="")):
     """ADMIN_API_KEY が設定されている場合のみ、X-API-Key ヘッダをチェック"""
@@ -0,0 +1,91 @@
+# app/core/config.py
+# 環境変数（backend/.env）をプロセスで1回だけ読み、鍵・接続先・パスを settings にまとめる。
+# 各モジュールは load_dotenv() を呼ばずにここを import する（import しただけで .env は読み込み済みになるので、
+# チューニング用の細かい os.getenv もそのまま効く）。
+import os
+import pathlib
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional
+
+from dotenv import load_dotenv
+
+BASE_DIR = pathlib.Path(__file__).resolve().parent.parent.parent  # backend/
+
+
+def _flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).lower() == "true"
+
+
+def _path(raw: Optional[str]) -> Optional[pathlib.Path]:
+    """相対パスは backend/ 基準の絶対パスにする（.env と secret は同じ階層）"""
+    if not raw:
+        return None
+    p = pathlib.Path(raw)
+    return p if p.is_absolute() else (BASE_DIR / p).resolve()
+
+
+@dataclass(frozen=True)
+class Settings:
+    # DB
+    database_url: Optional[str]  # 指定時は DB_* より優先（bench/ の sqlite など）
+    db_user: Optional[str]
+    db_password: Optional[str]
+    db_host: Optional[str]
+    db_port: int
+    db_name: Optional[str]
+    ssl_ca_path: Optional[pathlib.Path]
+    db_create_all: bool  # 起動時に create_all するか（既定 false。python -m app.db.database で別途作成）
+
+    # 外部API の鍵
+    openai_api_key: Optional[str]
+    openai_text_model: str
+    google_maps_api_key: str
+    google_places_api_key: Optional[str]
+    use_google_places: bool
+    yolp_app_id: Optional[str]
+    gemini_api_key: Optional[str]
+    gemini_model: str
+    admin_api_key: str
+
+    # Google TTS
+    google_application_credentials: Optional[pathlib.Path]
+    google_tts_endpoint: Optional[str]  # 指定時は REST + 匿名認証（bench/ の偽サーバなど）
+
+    # 保存先
+    media_root: pathlib.Path
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            database_url=os.getenv("DATABASE_URL"),
+            db_user=os.getenv("DB_USER"),
+            db_password=os.getenv("DB_PASSWORD"),
+            db_host=os.getenv("DB_HOST"),
+            db_port=int(os.getenv("DB_PORT", "3306")),
+            db_name=os.getenv("DB_NAME"),
+            ssl_ca_path=_path(os.getenv("SSL_CA_PATH")),
+            db_create_all=_flag("DB_CREATE_ALL"),
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            openai_text_model=os.getenv("OPENAI_TEXT_MODEL", "gpt-4o-mini"),
+            google_maps_api_key=os.getenv("GOOGLE_MAPS_API_KEY") or "",
+            google_places_api_key=os.getenv("GOOGLE_PLACES_API_KEY"),
+            use_google_places=_flag("USE_GOOGLE_PLACES"),
+            yolp_app_id=os.getenv("YOLP_APP_ID"),
+            gemini_api_key=os.getenv("GEMINI_API_KEY"),
+            gemini_model=os.getenv("GEMINI_MODEL", "gemini-1.5-flash"),
+            admin_api_key=os.getenv("ADMIN_API_KEY", "").strip(),
+            google_application_credentials=_path(os.getenv("GOOGLE_APPLICATION_CREDENTIALS")),
+            google_tts_endpoint=os.getenv("GOOGLE_TTS_ENDPOINT"),
+            media_root=_path(os.getenv("MEDIA_ROOT")) or BASE_DIR / "media",
+        )
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    # 既に設定済みの環境変数（本番の env / bench/run.py）は .env で上書きしない
+    load_dotenv(BASE_DIR / ".env")
+    return Settings.from_env()
+
+
+settings = get_settings()
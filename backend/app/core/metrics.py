@@ -0,0 +1,185 @@
+# app/core/metrics.py
+# Prometheus 形式のメトリクス（/metrics で公開）。
+# uvicorn を複数ワーカーで動かす時は、起動前に PROMETHEUS_MULTIPROC_DIR（空の書き込み可能ディレクトリ）を
+# 環境変数で渡すこと。各ワーカーの値がそこに書き出され、/metrics でまとめて集計される。
+import asyncio
+import os
+import time
+from typing import Optional
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+LOOP_LAG_INTERVAL = float(os.getenv("METRICS_LOOP_LAG_INTERVAL", "0.5"))  # 秒
+
+# timing.span の名前のうち、外部プロバイダとして数えるもの
+PROVIDERS = {"google_places", "yolp", "nominatim", "gemini", "openai", "google_tts"}
+
+_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "serendigo_http_request_duration_seconds",
+    "HTTP request latency by route",
+    ["method", "route", "status"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_LATENCY = Histogram(
+    "serendigo_upstream_request_duration_seconds",
+    "Outbound provider call latency",
+    ["provider"],
+    buckets=_LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    "serendigo_upstream_errors_total",
+    "Outbound provider call failures",
+    ["provider", "kind"],  # kind: timeout / error
+)
+DB_QUERY_LATENCY = Histogram(
+    "serendigo_db_query_duration_seconds",
+    "SQL statement execution time",
+    buckets=_LATENCY_BUCKETS,
+)
+CACHE_LOOKUPS = Counter(
+    "serendigo_cache_lookups_total",
+    "In-process cache lookups (hit ratio = hit+stale / all)",
+    ["cache", "result"],  # result: hit / stale / miss
+)
+SINGLEFLIGHT_CALLS = Counter(
+    "serendigo_singleflight_calls_total",
+    "Single-flight calls, split into upstream leaders and coalesced followers",
+    ["name", "role"],  # role: leader / shared
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "serendigo_db_pool_checkout_wait_seconds",
+    "Time spent waiting for a pooled DB connection (includes new connects)",
+    ["engine"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30),
+)
+POOL_CONNECTIONS = Gauge(
+    "serendigo_db_pool_connections",
+    "DB pool size and checked-out connections",
+    ["engine", "state"],  # state: size / checked_out
+    multiprocess_mode="livesum",
+)
+OPENAI_TOKENS = Histogram(
+    "serendigo_openai_tokens",
+    "Tokens used per OpenAI generation (sum / count = tokens per guide)",
+    ["model", "kind"],  # kind: prompt / completion
+    buckets=(50, 100, 200, 400, 600, 800, 1200, 1600, 2400, 4000),
+)
+OPENAI_RETRIES = Counter(
+    "serendigo_openai_retries_total",
+    "OpenAI calls retried after a transient failure",
+    ["reason"],  # reason: rate_limit / server_error / connection
+)
+LOOP_LAG = Histogram(
+    "serendigo_event_loop_lag_seconds",
+    "Event loop scheduling delay",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5),
+)
+
+
+# ---- timing.py からのフック ----
+def _is_timeout(error: BaseException) -> bool:
+    name = type(error).__name__
+    return isinstance(error, asyncio.TimeoutError) or "Timeout" in name or name == "DeadlineExceeded"
+
+
+def observe_span(name: str, seconds: float, error: Optional[BaseException]) -> None:
+    if name == "db":
+        DB_QUERY_LATENCY.observe(seconds)
+        return
+    if name not in PROVIDERS:
+        return
+    UPSTREAM_LATENCY.labels(name).observe(seconds)
+    if error is not None and not isinstance(error, asyncio.CancelledError):
+        UPSTREAM_ERRORS.labels(name, "timeout" if _is_timeout(error) else "error").inc()
+
+
+def observe_request(method: str, route: str, status: int, seconds: float) -> None:
+    REQUEST_LATENCY.labels(method, route, str(status)).observe(seconds)
+
+
+# ---- DBプール: 取得待ち時間と接続数 ----
+class _TimedPoolMixin:
+    metrics_engine = "sync"
+
+    def _do_get(self):
+        t0 = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.labels(self.metrics_engine).observe(time.perf_counter() - t0)
+
+
+class TimedQueuePool(_TimedPoolMixin, QueuePool):
+    metrics_engine = "sync"
+
+
+class TimedAsyncQueuePool(_TimedPoolMixin, AsyncAdaptedQueuePool):
+    metrics_engine = "async"
+
+
+def instrument_pool(sync_engine, label: str) -> None:
+    pool = sync_engine.pool
+
+    def _update(*_args):
+        POOL_CONNECTIONS.labels(label, "size").set(pool.size())
+        POOL_CONNECTIONS.labels(label, "checked_out").set(pool.checkedout())
+
+    event.listen(sync_engine, "checkout", _update)
+    event.listen(sync_engine, "checkin", _update)
+    _update()
+
+
+# ---- イベントループの遅延 ----
+async def _loop_lag_monitor() -> None:
+    loop = asyncio.get_running_loop()
+    while True:
+        t0 = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        LOOP_LAG.observe(max(0.0, loop.time() - t0 - LOOP_LAG_INTERVAL))
+
+
+_lag_task: Optional[asyncio.Task] = None
+
+
+async def startup() -> None:
+    global _lag_task
+    if _lag_task is None:
+        _lag_task = asyncio.create_task(_loop_lag_monitor())
+
+
+async def shutdown() -> None:
+    global _lag_task
+    if _lag_task is not None:
+        _lag_task.cancel()
+        await asyncio.gather(_lag_task, return_exceptions=True)
+        _lag_task = None
+
+
+# ---- 出力 ----
+def render() -> tuple[bytes, str]:
+    """(本文, Content-Type)。マルチプロセス時は全ワーカー分をディレクトリから集計"""
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    from prometheus_client import REGISTRY
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """gunicorn 等の child_exit フックから呼ぶ（livesum ゲージの掃除）"""
+    if MULTIPROC_DIR:
+        multiprocess.mark_process_dead(pid)
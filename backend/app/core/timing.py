@@ -0,0 +1,220 @@
+# app/core/timing.py
+# リクエスト単位の処理時間内訳（Google / YOLP / Gemini / OpenAI / TTS / DB / シリアライズ）を集計し、
+# Server-Timing ヘッダと1行JSONのログで出す。
+#
+# 使い方（サービス側）:
+#     with span("google_places"):
+#         r = await client.get(...)
+# リクエスト外（バックグラウンド処理など）で呼ばれた場合は何もしない。
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+
+TIMING_LOG = os.getenv("TIMING_LOG", "true").lower() == "true"
+
+logger = logging.getLogger("serendigo.timing")
+if not logger.handlers:
+    _h = logging.StreamHandler()
+    _h.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_h)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+
+class RequestTiming:
+    """1リクエスト分の span 集計（名前ごとに合計ms と回数）"""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: Dict[str, List[float]] = {}
+        self.endpoint_done: Optional[float] = None
+        self._lock = threading.Lock()  # 同期ルートは threadpool から記録してくる
+
+    def add(self, name: str, ms: float) -> None:
+        with self._lock:
+            agg = self.spans.setdefault(name, [0.0, 0])
+            agg[0] += ms
+            agg[1] += 1
+
+    def header_value(self, total_ms: float) -> str:
+        parts = []
+        for name, (ms, count) in self.spans.items():
+            desc = f';desc="{count} calls"' if count > 1 else ""
+            parts.append(f"{name};dur={ms:.1f}{desc}")
+        parts.append(f"total;dur={total_ms:.1f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+# span 終了時に呼ばれるフック（metrics などが登録する）: fn(name, seconds, error)
+_observers: List[Callable[[str, float, Optional[BaseException]], None]] = []
+
+# リクエスト終了時に呼ばれるフック: fn(method, route, status, seconds)
+_request_observers: List[Callable[[str, str, int, float], None]] = []
+
+
+def add_observer(fn: Callable[[str, float, Optional[BaseException]], None]) -> None:
+    _observers.append(fn)
+
+
+def add_request_observer(fn: Callable[[str, str, int, float], None]) -> None:
+    _request_observers.append(fn)
+
+
+def current() -> Optional[RequestTiming]:
+    return _current.get()
+
+
+def record(name: str, seconds: float, error: Optional[BaseException] = None) -> None:
+    rt = _current.get()
+    if rt is not None:
+        rt.add(name, seconds * 1000.0)
+    for fn in _observers:
+        try:
+            fn(name, seconds, error)
+        except Exception:
+            pass
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """with span("gemini"): ... の区間を計測（async 関数内の await を挟んでも使える）"""
+    t0 = time.perf_counter()
+    error: Optional[BaseException] = None
+    try:
+        yield
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        record(name, time.perf_counter() - t0, error)
+
+
+# ---- DB時間: SQLAlchemy のカーソル実行を計測 ----
+def instrument_engine(sync_engine) -> None:
+    """Engine（AsyncEngine は .sync_engine）にイベントを付けて、クエリ時間を "db" に積む"""
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_timing_t0", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get("_timing_t0")
+        if stack:
+            record("db", time.perf_counter() - stack.pop())
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _error(ctx):
+        stack = ctx.connection.info.get("_timing_t0") if ctx.connection is not None else None
+        if stack:
+            record("db", time.perf_counter() - stack.pop(), ctx.original_exception)
+
+
+# ---- ルート: エンドポイント本体の終了時刻を記録し、残りをシリアライズ時間とみなす ----
+class TimedRoute(APIRoute):
+    """
+    APIRouter(route_class=TimedRoute) で使う。
+    endpoint 関数の実行時間を "endpoint"、戻り値の検証/JSON化からレスポンス生成までを "serialize" に積む。
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        call = self.dependant.call
+        if call is None:
+            return
+        # FastAPI は作成時に async/sync を判定済みなので、同じ種類の関数で包む
+        if asyncio.iscoroutinefunction(call):
+            async def timed_call(**values):
+                t0 = time.perf_counter()
+                try:
+                    return await call(**values)
+                finally:
+                    _endpoint_done(t0)
+        else:
+            def timed_call(**values):
+                t0 = time.perf_counter()
+                try:
+                    return call(**values)
+                finally:
+                    _endpoint_done(t0)
+        self.dependant.call = timed_call
+
+    def get_route_handler(self) -> Callable:
+        handler = super().get_route_handler()
+
+        async def timed_handler(request):
+            response = await handler(request)
+            rt = _current.get()
+            if rt is not None and rt.endpoint_done is not None:
+                rt.add("serialize", (time.perf_counter() - rt.endpoint_done) * 1000.0)
+            return response
+
+        return timed_handler
+
+
+def _endpoint_done(t0: float) -> None:
+    now = time.perf_counter()
+    rt = _current.get()
+    if rt is not None:
+        rt.add("endpoint", (now - t0) * 1000.0)
+        rt.endpoint_done = now
+
+
+# ---- ミドルウェア: ヘッダ付与と構造化ログ ----
+class TimingMiddleware:
+    """純ASGIミドルウェア（StreamingResponse / SSE でもボディをバッファしない）"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        rt = RequestTiming()
+        token = _current.set(rt)
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                total_ms = (time.perf_counter() - rt.started) * 1000.0
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", rt.header_value(total_ms).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            elapsed = time.perf_counter() - rt.started
+            # ルートのテンプレート（/visits/{id} など）。未マッチは1本にまとめてラベルを増やさない
+            route = getattr(scope.get("route"), "path", None)
+            for fn in _request_observers:
+                try:
+                    fn(scope.get("method", ""), route or "__unmatched__", status["code"], elapsed)
+                except Exception:
+                    pass
+            if TIMING_LOG:
+                logger.info(json.dumps({
+                    "type": "timing",
+                    "method": scope.get("method"),
+                    "path": scope.get("path"),
+                    "route": route,
+                    "status": status["code"],
+                    "total_ms": round(elapsed * 1000.0, 1),
+                    "spans": {k: {"ms": round(v[0], 1), "count": v[1]} for k, v in rt.spans.items()},
+                }, ensure_ascii=False))
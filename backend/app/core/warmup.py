@@ -0,0 +1,151 @@
+# app/core/warmup.py
+# 起動直後のワーカーは、最初のリクエストで DB プールの接続、外部API への DNS / TLS、
+# SDK の import、OpenAPI スキーマ生成などをまとめて払う。lifespan から start() で裏で先に済ませ、
+# 終わるまで /ready は 503 を返す（/health は生存確認なので常に 200）。
+# ロードバランサのヘルスチェックは /ready に向けること。
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "20"))           # これを過ぎたら終わっていなくても ready にする
+WARMUP_DB_CONNECTIONS = int(os.getenv("WARMUP_DB_CONNECTIONS", "5"))  # 同期/async それぞれ先に張る接続数（pool_size 以下）
+# 先に接続しておく http_client のプロバイダ（カンマ区切り。空なら全部）
+WARMUP_HTTP_PROVIDERS = [p.strip() for p in os.getenv("WARMUP_HTTP_PROVIDERS", "").split(",") if p.strip()]
+
+_state: Dict[str, object] = {"ready": False, "started_at": None, "finished_at": None, "steps": {}}
+_task: Optional[asyncio.Task] = None
+
+
+# ---- 各ステップ（失敗しても ready にはする。初回リクエストで改めて作られるだけ）----
+def _warm_sync_db() -> None:
+    from app.db.database import engine
+
+    conns = []
+    try:
+        for _ in range(max(1, WARMUP_DB_CONNECTIONS)):
+            conn = engine.connect()  # 同時に握って、プールに N 本残す
+            conns.append(conn)
+            conn.execute(text("SELECT 1"))
+    finally:
+        for conn in conns:
+            conn.close()
+
+
+async def _warm_async_db() -> None:
+    from app.db.database import async_engine
+
+    async def _one():
+        conn = await async_engine.connect()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    results = await asyncio.gather(*(_one() for _ in range(max(1, WARMUP_DB_CONNECTIONS))), return_exceptions=True)
+    for r in results:
+        if not isinstance(r, BaseException):
+            await r.close()
+    errors = [r for r in results if isinstance(r, BaseException)]
+    if errors:
+        raise errors[0]
+
+
+async def _warm_http() -> None:
+    from app.services import http_client
+
+    results = await http_client.warmup(WARMUP_HTTP_PROVIDERS or None)
+    failed = {k: v for k, v in results.items() if v != "ok"}
+    if failed:
+        raise RuntimeError(f"http warmup failed: {failed}")
+
+
+async def _warm_tts() -> None:
+    from app.services import tts
+
+    await tts.warmup()
+
+
+async def _warm_openai() -> None:
+    from app.services import gpt
+
+    await gpt.warmup()
+
+
+def _steps(app: FastAPI) -> Dict[str, Callable[[], Awaitable[None]]]:
+    return {
+        "db_sync": lambda: run_in_threadpool(_warm_sync_db),
+        "db_async": _warm_async_db,
+        "http": _warm_http,
+        "tts": _warm_tts,
+        "openai": _warm_openai,
+        # /docs を開いた時と同じく、全ルートの Pydantic モデルから JSON Schema を作っておく
+        "openapi": lambda: run_in_threadpool(app.openapi),
+    }
+
+
+async def _run_step(name: str, fn: Callable[[], Awaitable[None]]) -> None:
+    steps = _state["steps"]
+    t0 = time.perf_counter()
+    try:
+        await fn()
+        steps[name] = {"status": "ok", "ms": round((time.perf_counter() - t0) * 1000, 1)}
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        steps[name] = {"status": "failed", "error": repr(e), "ms": round((time.perf_counter() - t0) * 1000, 1)}
+        print(f"[WARMUP] {name} failed:", repr(e))
+
+
+async def _run(app: FastAPI) -> None:
+    _state["started_at"] = time.time()
+    steps = _steps(app)
+    for name in steps:
+        _state["steps"][name] = {"status": "running"}
+    tasks: List[asyncio.Task] = [asyncio.create_task(_run_step(n, fn)) for n, fn in steps.items()]
+    _, pending = await asyncio.wait(tasks, timeout=WARMUP_TIMEOUT)
+    for t in pending:
+        t.cancel()  # スレッド内の処理は止まらないが、待つのはやめる
+    for name, st in _state["steps"].items():
+        if st.get("status") == "running":
+            _state["steps"][name] = {"status": "timeout"}
+    _state["finished_at"] = time.time()
+    _state["ready"] = True
+    print(f"[WARMUP] ready in {_state['finished_at'] - _state['started_at']:.2f}s: "
+          f"{ {n: s['status'] for n, s in _state['steps'].items()} }")
+
+
+async def start(app: FastAPI) -> None:
+    """lifespan 開始時に呼ぶ（待たずに戻る）。WARMUP_ENABLED=false ならすぐ ready"""
+    global _task
+    if not WARMUP_ENABLED:
+        _state["ready"] = True
+        return
+    if _task is None:
+        _task = asyncio.create_task(_run(app))
+
+
+async def stop() -> None:
+    """lifespan 終了時に呼ぶ。まず not ready にして新しいトラフィックを止めてもらう"""
+    global _task
+    _state["ready"] = False
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+
+
+def is_ready() -> bool:
+    return bool(_state["ready"])
+
+
+def status() -> dict:
+    return {
+        "status": "ready" if _state["ready"] else "warming",
+        "steps": _state["steps"],
+        "started_at": _state["started_at"],
+        "finished_at": _state["finished_at"],
+    }
@@ -1,53 +1,110 @@
-import os
-from pathlib import Path
-from dotenv import load_dotenv
-from sqlalchemy import create_engine
-from sqlalchemy.engine import URL
+import ssl
+from sqlalchemy import create_engine, inspect, text
+from sqlalchemy.engine import URL, make_url
 from sqlalchemy.orm import declarative_base, sessionmaker, Session
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from app.core.config import settings
+from app.core.metrics import TimedQueuePool, TimedAsyncQueuePool  # プール取得待ちの計測付き
 
-load_dotenv()
-
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT", "3306")
-DB_NAME = os.getenv("DB_NAME")
-SSL_CA_PATH = os.getenv("SSL_CA_PATH")  # .envで設定
-
-# DB URL を安全に構築
-database_url = URL.create(
-    drivername="mysql+pymysql",
-    username=DB_USER,
-    password=DB_PASSWORD,
-    host=DB_HOST,
-    port=int(DB_PORT),
-    database=DB_NAME,
-    query={"charset": "utf8mb4"},
+# DB URL を安全に構築（DATABASE_URL 指定時は DB_* より優先）
+if settings.database_url:
+    database_url = make_url(settings.database_url)
+else:
+    database_url = URL.create(
+        drivername="mysql+pymysql",
+        username=settings.db_user,
+        password=settings.db_password,
+        host=settings.db_host,
+        port=settings.db_port,
+        database=settings.db_name,
+        query={"charset": "utf8mb4"},
+    )
+
+# async ルート用のドライバ（MySQL は asyncmy）。接続先は同期側と同じ
+_ASYNC_DRIVERS = {"mysql": "mysql+asyncmy", "sqlite": "sqlite+aiosqlite"}
+async_database_url = database_url.set(
+    drivername=_ASYNC_DRIVERS.get(database_url.get_backend_name(), database_url.drivername)
 )
 
 # SSL 証明書の絶対パス解決
 connect_args = {}
-if SSL_CA_PATH:
-    ca_abs = str(Path(SSL_CA_PATH).resolve())  # ← ここで絶対パスに変換！
-    print(f"★ mysql ssl ca (resolved) => {ca_abs}  exists={Path(ca_abs).is_file()}")
-    if not Path(ca_abs).is_file():
+async_connect_args = {}
+if settings.ssl_ca_path:
+    ca_abs = str(settings.ssl_ca_path)  # settings で絶対パスに変換済み
+    if not settings.ssl_ca_path.is_file():
         raise FileNotFoundError(f"SSL_CA_PATH not found: {ca_abs}")
     connect_args = {"ssl": {"ca": ca_abs}}
+    # asyncmy は dict ではなく SSLContext を受け取る
+    async_connect_args = {"ssl": ssl.create_default_context(cafile=ca_abs)}
 
 engine = create_engine(
     database_url,
+    poolclass=TimedQueuePool,
     pool_pre_ping=True,
     pool_recycle=1800,
     echo=False,
     connect_args=connect_args,
 )
 
+# async def のルートはこちらを使う（同期Sessionだとクエリ中イベントループが止まるため）
+async_engine = create_async_engine(
+    async_database_url,
+    poolclass=TimedAsyncQueuePool,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    echo=False,
+    connect_args=async_connect_args,
+)
+
 Base = declarative_base()
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session)
+# commit 後も属性を読めるよう expire_on_commit=False（レスポンス組み立てで再SELECTしない）
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+# create_all は既存テーブルに列を足さないので、後から足した列はここに並べて init_db で ALTER TABLE する
+# （テーブル, 列, 型）。NULL 可にしておく（既存行はそのまま）
+_ADDED_COLUMNS = [
+    ("destinations", "details_fetched_at", "DATETIME NULL"),
+    ("guides", "age_group", "VARCHAR(50) NULL"),
+    ("guides", "gender", "VARCHAR(10) NULL"),
+]
+
+def _add_missing_columns() -> None:
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in _ADDED_COLUMNS:
+            if not insp.has_table(table):
+                continue
+            if column in {c["name"] for c in insp.get_columns(table)}:
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            print(f"[DB] added column {table}.{column}")
+
+# index=True も同じく既存テーブルには張られないので、後から足したものはここに並べる（テーブル, 名前, 列）
+_ADDED_INDEXES = [
+    ("guides", "ix_guides_audio_url", ["audio_url"]),  # media_store.evict の IN 検索
+]
+
+def _add_missing_indexes() -> None:
+    insp = inspect(engine)
+    with engine.begin() as conn:
+        for table, name, columns in _ADDED_INDEXES:
+            if not insp.has_table(table):
+                continue
+            # 名前が違っても同じ列の index があれば足さない
+            existing = insp.get_indexes(table)
+            if any(ix["name"] == name or ix["column_names"] == columns for ix in existing):
+                continue
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+            print(f"[DB] added index {table}.{name}")
 
 def init_db() -> None:
+    """テーブル作成（無いものだけ）と、後から足した列 / index の追加。起動時は DB_CREATE_ALL=true の時だけ呼ぶ。
+    デプロイ時は python -m app.db.database で1回流す（何度流してもよい）"""
     from app.db import models  # noqa: F401
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+    _add_missing_indexes()
 
 def get_db():
     db = SessionLocal()
@@ -55,3 +112,15 @@ def get_db():
         yield db
     finally:
         db.close()
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+if __name__ == "__main__":
+    # __main__ として読まれた側の Base には models が載らないので、パッケージ側を呼ぶ
+    from app.db import database
+
+    database.init_db()
+    print(f"[DB] schema up to date: {database.database_url.render_as_string(hide_password=True)}")
@@ -1,5 +1,5 @@
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from sqlalchemy import String, Float, DateTime, func, UniqueConstraint, ForeignKey, Text, Integer
+from sqlalchemy import String, Float, DateTime, func, UniqueConstraint, ForeignKey, Text, Integer, BigInteger
 import uuid, datetime as dt
 from sqlalchemy import Column, Integer, String #からちゃん追加
 #from sqlalchemy.ext.declarative import declarative_base #からちゃん追加
@@ -20,6 +20,8 @@ class Destination(Base):
     lat: Mapped[float] = mapped_column(Float)
     lng: Mapped[float] = mapped_column(Float)
     created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+    # Places Details で最後に取り直した時刻（UTC）。NULL なら created_at の時に取ったもの
+    details_fetched_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
 
     # Guides へのリレーション（1:N）
     guides: Mapped[list["Guide"]] = relationship(
@@ -52,13 +54,44 @@ class Guide(Base):
     guide_text: Mapped[str] = mapped_column(Text, nullable=False)
     voice: Mapped[str | None] = mapped_column(String(64), nullable=True)
     style: Mapped[str | None] = mapped_column(String(64), nullable=True)
-    audio_url: Mapped[str] = mapped_column(String(512), nullable=False)
+    # media_store の削除判定で IN 検索するので index を張る
+    audio_url: Mapped[str] = mapped_column(String(512), nullable=False, index=True)
+    # 生成時に使った利用者セグメント（guide_reuse の使い回しの単位。プロフィール無しなら NULL）
+    age_group: Mapped[str | None] = mapped_column(String(50), nullable=True)
+    gender: Mapped[str | None] = mapped_column(String(10), nullable=True)
     created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
     
     # Destination テーブルとのリレーション
     destination = relationship("Destination", back_populates="guides")
     visit = relationship("VisitHistory", back_populates="guides")
 
+
+class GuideJob(Base):
+    """POST /visits/jobs のガイド生成ジョブ（app/services/guide_jobs.py）。どのワーカーからも状態を引けるよう DB に置く"""
+    __tablename__ = "guide_jobs"
+
+    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    visit_id: Mapped[str] = mapped_column(String(36), ForeignKey("visit_histories.id"), index=True, nullable=False)
+    destination_id: Mapped[str] = mapped_column(String(36), ForeignKey("destinations.id"), nullable=False)
+    status: Mapped[str] = mapped_column(String(16), nullable=False, default="queued")  # queued / running / done / failed
+    guide_id: Mapped[str | None] = mapped_column(String(36), nullable=True)
+    audio_url: Mapped[str | None] = mapped_column(String(512), nullable=True)
+    error: Mapped[str | None] = mapped_column(String(128), nullable=True)
+    # server_default ではなく Python 側で入れる（commit 後に再 SELECT せずレスポンスに使える）
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), default=dt.datetime.utcnow, nullable=False)
+    finished_at: Mapped[dt.datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+
+
+class MediaObject(Base):
+    """/media 配下のファイル（app/services/media_store.py が容量管理に使う）"""
+    __tablename__ = "media_objects"
+
+    # MEDIA_ROOT からの相対パス（guides/ab/cd/<hash>.mp3）。公開URLは /media/<path>
+    path: Mapped[str] = mapped_column(String(255), primary_key=True)
+    size: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    last_access_at: Mapped[dt.datetime] = mapped_column(DateTime, index=True, nullable=False)  # UTC
+    created_at: Mapped[dt.datetime] = mapped_column(DateTime(timezone=True), server_default=func.now())
+
 #models.DetourSuggestion の対応
 #class DetourSuggestion(Base):
     #__tablename__ = "detour_suggestions"
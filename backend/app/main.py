@@ -1,38 +1,19 @@
 # app/main.py
-from dotenv import load_dotenv
-import pathlib
-import os
-# backend/.env を明示的に読み込む
-env_path = pathlib.Path(__file__).resolve().parent.parent / ".env"
-load_dotenv(dotenv_path=env_path)
-
-# .env の変数を取得
-cred_path_raw = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-
-# backend/ をベースにする（.envとsecretは同じ階層）
-base_dir = pathlib.Path(__file__).resolve().parent.parent
-cred_path_abs = (base_dir / cred_path_raw).resolve() if cred_path_raw else None
-
-if cred_path_raw:
-    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = str(cred_path_abs)
-    print(f"★ cred_path (raw) >> {cred_path_raw}")
-    print(f"★ cred_path (absolute) >> {cred_path_abs}")
-    print(f"★ os.path.exists(cred_path) >> {os.path.exists(cred_path_abs)}")
-else:
-    print("⚠️ .envに GOOGLE_APPLICATION_CREDENTIALS が定義されていません")
+# backend/.env の読み込みと GOOGLE_APPLICATION_CREDENTIALS の絶対パス化は app/core/config.py で1回だけ行う
+from app.core.config import settings
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 # app/main.py どこかに追記（importは上へ）
 from sqlalchemy import text, inspect
-from app.db.database import engine
+from app.db.database import engine, async_engine
 
 # ルーター
 from app.routes.google_places_api import router as places_router          # ← AI/外部API系は async のままでOK
 from app.routes.destination_api import router as destinations_router      # ← DB同期ルートは def に統一
 from app.routes.visit_and_guide_api import router as visits_router
 from app.routes.detours import router as detours_router
+from app.routes.media import router as media_router
 
 # ★ 追加：ルータをインポートきたな
 from app.routers import detour_adapter
@@ -44,8 +25,45 @@ from app.routes import user_login_api
 
 # DB初期化（同期）
 from app.db.database import init_db
-
-app = FastAPI(title="SerendiGo API")
+# 外部API用の共有HTTPクライアント
+from app.services import http_client, write_behind, tts, media_store, guide_jobs
+from app.services.cache import cache_stats
+from app.services.singleflight import singleflight_stats
+
+from contextlib import asynccontextmanager
+from fastapi.concurrency import run_in_threadpool
+from app.core import timing, metrics, warmup
+from app.core.timing import TimingMiddleware
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 起動時の create_all はリモート MySQL への往復が多く、ワーカーの起動が遅くなるので既定では行わない。
+    # スキーマはデプロイ時に python -m app.db.database で作る（ローカル開発 / bench は DB_CREATE_ALL=true）
+    if settings.db_create_all:
+        await run_in_threadpool(init_db)
+    # 外部API用のコネクションプールを生成（keep-alive / HTTP/2 を全リクエストで共有）
+    await http_client.startup()
+    # 説明文生成などの write-behind ワーカー
+    await write_behind.start_all()
+    # イベントループ遅延の計測
+    await metrics.startup()
+    # /media の容量管理（アクセス記録の反映と古いファイルの削除）
+    await media_store.startup()
+    # DB プール / 外部API 接続 / TTS・OpenAI クライアント / OpenAPI を裏で温める（終わるまで /ready は 503）
+    await warmup.start(app)
+    try:
+        yield
+    finally:
+        await warmup.stop()
+        await metrics.shutdown()
+        await write_behind.stop_all()
+        await guide_jobs.shutdown()  # drain しきれなかったジョブを failed にする
+        await media_store.shutdown()  # write-behind（.ogg 作成など）が書いた分まで記録してから
+        await tts.shutdown()
+        await http_client.shutdown()
+        await async_engine.dispose()
+
+app = FastAPI(title="SerendiGo API", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -54,15 +72,25 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
+# 処理時間の内訳（Server-Timing ヘッダ + 1行JSONログ）。最後に add = 一番外側で計測
+app.add_middleware(TimingMiddleware)
+timing.instrument_engine(engine)
+timing.instrument_engine(async_engine.sync_engine)
+# Prometheus: span / リクエスト計測を流し込み、DBプールの接続数も追う
+timing.add_observer(metrics.observe_span)
+timing.add_request_observer(metrics.observe_request)
+metrics.instrument_pool(engine, "sync")
+metrics.instrument_pool(async_engine.sync_engine, "async")
+
 # 3) DBテーブル作成（SQLiteの開発用）
 #Base.metadata.create_all(bind=engine)(一旦コメントアウトbyきたな)
 
 # 4) メディア配信（TTSのmp3 / フォールバックのtxt を返す用）
 # app.mount("/media", StaticFiles(directory=os.getenv("MEDIA_ROOT", "./media")), name="media")
-media_root = pathlib.Path(__file__).resolve().parent.parent / "media"
-app.mount("/media", StaticFiles(directory=pathlib.Path(__file__).parent.parent / "media"), name="media")
+# Range(206) / ETag(304) / immutable に対応した app/routes/media.py で配信する（StaticFiles から置き換え）
 # mps3 音声再生のテスト用エンドポイント ※実際の運用では不要、削除可能byからちゃん
 from fastapi.responses import HTMLResponse
 # メディア配信（ディレクトリが無いと起動エラーになるので作成しておくGPTおすすめbyきたな）
@@ -76,16 +104,23 @@ app.include_router(destinations_router)
 app.include_router(visits_router)
 app.include_router(detours_router)
 app.include_router(user_login_api.router)
+app.include_router(media_router)
 
-# ヘルスチェック
+# ヘルスチェック（プロセスの生存確認）
 @app.get("/health")
 def health():
     return {"status": "ok"}
 
-# ★ 起動時：同期DBの create_all を1回実行（await しない）
-@app.on_event("startup")
-def on_startup():
-    init_db()
+# レディネス（ロードバランサ用）。起動直後のウォームアップが終わるまで 503
+@app.get("/ready")
+def ready():
+    return JSONResponse(warmup.status(), status_code=200 if warmup.is_ready() else 503)
+
+# Prometheus スクレイプ用（マルチワーカー時は PROMETHEUS_MULTIPROC_DIR 経由で全ワーカー分を集計）
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
 
 # 音声再生のテスト用エンドポイント
 @app.get("/test-audio", response_class=HTMLResponse)
@@ -114,6 +149,15 @@ def __db_tables():
     insp = inspect(engine)
     return {"tables": insp.get_table_names()}
 
+@app.get("/__cache_stats")
+def __cache_stats():
+    # 外部API結果キャッシュのヒット/ミス数と single-flight の相乗り数、write-behind キューの状況
+    return {
+        "caches": cache_stats(),
+        "singleflight": singleflight_stats(),
+        "write_behind": write_behind.write_behind_stats(),
+    }
+
 # ★ 追加：ルータを登録きたな
 app.include_router(detour_adapter.router)  # → /detour/search が生える
 app.include_router(detour_guide.router)    # → /detour-guide/search が生える
@@ -1,15 +1,16 @@
 # app/routers/detour_adapter.py
 from fastapi import APIRouter, Query, Depends
+from app.core.timing import TimedRoute
 from typing import List, Dict, Any
 import math
 
 # 既存の実ルータ関数を呼ぶ
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import get_async_db
 from app.routes.detours import search_detours_core
 from app.schemas.detour import DetourSearchQuery, DetourType  # ← 追加
 
-router = APIRouter(prefix="/detour", tags=["Detour (Compat)"])
+router = APIRouter(prefix="/detour", tags=["Detour (Compat)"], route_class=TimedRoute)
 
 def cat_to_detour_type(category: str) -> DetourType:         # ← 戻り値型もEnum
     c = (category or "").lower()
@@ -36,7 +37,7 @@ async def search_detour_compat(
     lng: float = Query(139.767125),
     keyword: str | None = Query(None),  # ★追加
     local_only: bool = Query(False),          # ← 追加（UIから受け取れる）
-    db: Session = Depends(get_db),  # ← 追加：DBを受け取る
+    db: AsyncSession = Depends(get_async_db),  # ← 追加：DBを受け取る（コアは AsyncSession 前提）
 ):
     
         # 🔑 ここで必ず detour_type を定義
@@ -70,5 +71,7 @@ async def search_detour_compat(
             "category": category,
             "eta_text": eta_text(dkm, mode),
             "description": getattr(it, "description", "") or getattr(it, "note", "") or "",
+            "summary_id": getattr(it, "summary_id", None),          # 説明文の後追い取得用
+            "summary_pending": getattr(it, "summary_pending", False),
         })
     return out
@@ -1,7 +1,8 @@
 from fastapi import APIRouter, Depends, Query
+from app.core.timing import TimedRoute
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
-from app.db.database import get_db
+from app.db.database import get_async_db
 #from app.services.detour_places import search_places
 # 代わりに、実在する検索関数を使う
 from app.routes.detours import search_detours as core_search
@@ -10,7 +11,7 @@ from app.models.detour_history import DetourHistory
 from app.services.security import get_current_user
 from datetime import datetime
 
-router = APIRouter(prefix="/detour-guide", tags=["Detour Guide"])
+router = APIRouter(prefix="/detour-guide", tags=["Detour Guide"], route_class=TimedRoute)
 
 @router.get("/search", response_model=List[DetourSuggestion])
 async def search_detour_guide(
@@ -19,7 +20,7 @@ async def search_detour_guide(
     mode: TravelMode = Query("walk"),
     minutes: int = Query(15, ge=1, le=120),
     keyword: Optional[str] = Query(None),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),  # await db.commit() するので AsyncSession を渡す
     current_user=Depends(get_current_user)
 ):
     # 互換のコア検索を呼ぶ（引数はあるものだけ渡す）
@@ -30,7 +31,8 @@ async def search_detour_guide(
         mode=mode,
         minutes=minutes,
         detour_type=None,   # keyword を detour_type にマップするならここで変換
-        categories=None
+        categories=None,
+        db=db,
     )
 
     # DetourHistory 登録（元のまま）
@@ -1,5 +1,6 @@
 # app/routers/guide_history.py
 from fastapi import APIRouter, Depends, Query
+from app.core.timing import TimedRoute
 from sqlalchemy.orm import Session
 from sqlalchemy import select, func
 from datetime import datetime
@@ -33,7 +34,7 @@ class HistoryResponse(BaseModel):
     summary: Summary
     days: List[DayGroup]
 
-router = APIRouter(prefix="/guide-history", tags=["Guide History"])
+router = APIRouter(prefix="/guide-history", tags=["Guide History"], route_class=TimedRoute)
 
 @router.get("/", response_model=HistoryResponse)
 def get_history(
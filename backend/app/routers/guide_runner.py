@@ -1,9 +1,10 @@
 # app/routers/guide_runner.py
 from fastapi import APIRouter, Depends
+from app.core.timing import TimedRoute
 from pydantic import BaseModel
 from app.services.security import get_current_user
 
-router = APIRouter(prefix="/guide", tags=["Guide Runner"])
+router = APIRouter(prefix="/guide", tags=["Guide Runner"], route_class=TimedRoute)
 
 class GuideRunIn(BaseModel):
     destination: str
@@ -1,18 +1,19 @@
 from fastapi import APIRouter, Depends, Query, HTTPException, Header
+from app.core.timing import TimedRoute
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import IntegrityError
 from typing import List
-import os
+from app.core.config import settings
 from app.db.database import get_db
 from app.db import models
 from app.schemas.destination_schema import DestinationCreate, DestinationRead
 from app.services import google_places as svc
 from fastapi.concurrency import run_in_threadpool #(byきたな)
 
-router = APIRouter(prefix="/destinations", tags=["destinations"])
+router = APIRouter(prefix="/destinations", tags=["destinations"], route_class=TimedRoute)
 
 # --- 簡易APIキー保護（.env に ADMIN_API_KEY がある時だけ有効化）---
-ADMIN_API_KEY = os.getenv("ADMIN_API_KEY", "").strip()
+ADMIN_API_KEY = settings.admin_api_key
 
 def maybe_require_admin(x_api_key: str = Header(default="")):
     """ADMIN_API_KEY が設定されている場合のみ、X-API-Key ヘッダをチェック"""
@@ -80,8 +81,23 @@ async def register_from_place_id(
     """
     place_id だけ受け取り、サーバー側で Places Details を取得して保存する。
     フロントは details 結果を組み立てる必要なし。
+    既に登録済みの place_id なら Google を呼ばずにその行を返す。
     """
-    # 1) 外部APIは非同期で取得（byきたな）
+    # 0) 登録済みならそのまま返す（Places Details の課金・待ち時間なし）
+    existing = await run_in_threadpool(
+        lambda: db.query(models.Destination).filter_by(place_id=place_id).first()
+    )
+    if existing is not None:
+        return DestinationRead(
+            id=existing.id,
+            placeId=existing.place_id,
+            name=existing.name,
+            address=existing.address,
+            lat=existing.lat,
+            lng=existing.lng,
+        )
+
+    # 1) 外部APIは非同期で取得（byきたな）。LRU → destinations → Google の順に引く
     data = await svc.details(place_id)
     if not data or "geometry" not in data or "location" not in data["geometry"]:
         raise HTTPException(status_code=404, detail="Place details not found")
@@ -1,25 +1,30 @@
 # backend/app/routes/detours.py
 from fastapi import APIRouter, Query, Depends, HTTPException
-from typing import List, Optional
+from app.core.timing import TimedRoute
+from typing import Dict, List, Optional
 import math, uuid, re, unicodedata  # 追加8/21: チェーン判定のため re を使用
+import asyncio, os
 from datetime import datetime  # 追加8/21: created_at統一のため
-from sqlalchemy import select, desc
-from sqlalchemy.orm import Session
+from sqlalchemy import select, desc, func, tuple_
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.schemas.detour import (
     DetourSearchQuery,
     DetourSuggestion,
     DetourHistoryItem,
+    DetourSummary,
     TravelMode,   # 追加8/21: Query型を厳密化
     DetourType,   # 追加8/21: Query型を厳密化
 )
 from app.services.geo import minutes_to_radius_km, haversine_km
 from app.services.places_nearby import google_nearby
 from app.services.events import reverse_geocode_city, connpass_events
-from app.db.database import get_db                  # ← 同期Sessionを返す
+from app.db.database import get_async_db, AsyncSessionLocal  # ← AsyncSessionを返す（イベントループを塞がない）
 from app.models.detour_history import DetourHistory
 from app.models.detour_suggestion import SpotSummary  # ← 追加：説明キャッシュ用8/23
+from app.services.write_behind import WriteBehindQueue
 
-router = APIRouter(prefix="/detour", tags=["Detour"])  # 修正8/21: prefix/tagsを明示
+router = APIRouter(prefix="/detour", tags=["Detour"], route_class=TimedRoute)  # 修正8/21: prefix/tagsを明示
 
 # 追加8/21: 簡易チェーン判定（必要に応じて拡張）
 _CHAIN_RE = re.compile(
@@ -34,6 +39,20 @@ _CORP_RE = re.compile(
     r"一般社団法人|一般財団法人|公益社団法人|公益財団法人)"
 )
 
+# 説明文の生成1件あたりの締め切り（秒）。超えたらフォールバック文を使う
+SUMMARY_DEADLINE = float(os.getenv("DETOUR_SUMMARY_DEADLINE", "8"))
+# "background": 生成は裏で行い検索は即返す / "inline": 検索レスポンス内で生成を待つ
+SUMMARY_MODE = os.getenv("DETOUR_SUMMARY_MODE", "background").lower()
+SUMMARY_IDS_MAX = 50
+# 生成待ちとして空の spot_summaries 行を置いてから、この秒数は /detour/summaries で pending と答える
+# （キューはワーカーごとなので、積んだのと別のワーカーに来たポーリングは行の updated_at で判断する）
+SUMMARY_PENDING_TTL = float(os.getenv("DETOUR_SUMMARY_PENDING_TTL", "60"))
+_SUMMARY_QUEUE = WriteBehindQueue(
+    "spot_summaries",
+    workers=int(os.getenv("DETOUR_SUMMARY_WORKERS", "2")),
+    maxsize=int(os.getenv("DETOUR_SUMMARY_QUEUE_SIZE", "500")),
+)
+
 def _is_chain(name: str) -> bool:  # 追加8/21
     return bool(_CHAIN_RE.search(name or ""))
 
@@ -54,7 +73,7 @@ def _clean_shop_name(name: str) -> str:
 # =========================
 # コア検索（純粋関数）
 # =========================
-async def search_detours_core(query: DetourSearchQuery, db: Session) -> List[DetourSuggestion]:  # 修正8/21
+async def search_detours_core(query: DetourSearchQuery, db: AsyncSession) -> List[DetourSuggestion]:  # 修正8/21
     """
     history_only=True -> DB履歴のみを返す。
     local_only=True  -> 外部API検索は行い、結果からチェーン店舗を除外する。
@@ -83,10 +102,10 @@ async def search_detours_core(query: DetourSearchQuery, db: Session) -> List[Det
     # -------------------------
     if query.history_only:  # 追加8/21
         rows = (
-            db.execute(
+            await db.execute(
                 select(DetourHistory).order_by(desc(DetourHistory.id)).limit(100)
-            ).scalars().all()
-        )
+            )
+        ).scalars().all()
         suggestions: List[DetourSuggestion] = []
         for r in rows:
             d_km = haversine_km(query.lat, query.lng, r.lat, r.lng)
@@ -180,38 +199,38 @@ async def search_detours_core(query: DetourSearchQuery, db: Session) -> List[Det
     results: List[DetourSuggestion] = []
     now_iso = datetime.utcnow().isoformat()
 
-    for x in top3:
+    # --- ここから：説明キャッシュの取得/生成 -------------------------
+    # 1) 既存の短文があれば使う
+    keys = [((x.get("source") or "google"), _detect_source_id(x)) for x in top3]
+    found = await _summary_get_many(db, keys)  # 1クエリでまとめて取得
+    descs: List[Optional[str]] = []
+    for k in keys:
+        row = found.get(k)
+        descs.append(row.short_text_ja if row and row.short_text_ja else None)
+
+    missing = [i for i, d in enumerate(descs) if not d]
+    pending: set = set()
+    if SUMMARY_MODE == "inline":
+        # 2) なければ Gemini で生成（全件まとめて並列・1件ごとに締め切りあり）
+        generated = await asyncio.gather(*(_generate_summary(top3[i]) for i in missing))
+        to_save: Dict[tuple, dict] = {}
+        for i, g in zip(missing, generated):
+            row = _summary_row(top3[i], *keys[i], g)
+            if row:
+                descs[i] = row["short_text"].strip()
+                to_save[keys[i]] = row
+        # 3) 新規生成分は1回の upsert + 1 commit で保存
+        await _summary_upsert_many(db, list(to_save.values()))
+    else:
+        # 2') 生成はバックグラウンドに回して即レスポンス（当面はフォールバック文）。
+        #     クライアントは summary_id で /detour/summaries を後から引く
+        for i in missing:
+            if _enqueue_summary(top3[i], *keys[i]):
+                pending.add(i)
+        await _mark_pending(db, [(top3[i], *keys[i]) for i in sorted(pending)])
+
+    for i, (x, desc) in enumerate(zip(top3, descs)):
         meters = int(x["distance_km"] * 1000)
-
-        # --- ここから：説明キャッシュの取得/生成 -------------------------
-        src = (x.get("source") or "google")
-        sid = _detect_source_id(x)
-
-        # 1) 既存の短文があれば使う
-        desc = None
-        row = _summary_get(db, src, sid)
-        if row and row.short_text_ja:
-            desc = row.short_text_ja
-        else:
-            # 2) なければ同期で最小生成（3件だけなので待ち時間は軽め）
-            #    address / category が無ければ None でOK
-            g = await gemini_summarize_place(
-                name=x.get("name", ""),
-                address=x.get("address") or x.get("vicinity"),
-                category=x.get("category")
-            )
-            if not g.get("error"):
-                desc_short = (g.get("short") or "").strip()
-                if desc_short:
-                    desc = desc_short
-                    _summary_upsert(
-                        db,
-                        source=src, source_id=sid,
-                        name=x.get("name", ""),
-                        lat=float(x["lat"]), lng=float(x["lng"]),
-                        short_text=g.get("short"), long_text=g.get("long"),
-                        provider="gemini-1.5-flash", lang="ja", tokens=g.get("tokens")
-                    )
         # 生成・取得ともに無ければ簡易フォールバック
         if not desc:
             desc = x.get("description") or f"{x.get('name','このスポット')}は周辺で立ち寄りやすい場所です。"
@@ -235,25 +254,29 @@ async def search_detours_core(query: DetourSearchQuery, db: Session) -> List[Det
                 created_at=now_iso,
                 eta_text=_eta_text(mode_str, x["duration_min"], meters),  # ★順序修正
                 detour_type=query.detour_type,
+                summary_id=_summary_key(*keys[i]),
+                summary_pending=i in pending,
             )
         )
     return results
 
 # --- summaries helper (append-only) ------------------------------------
-def _summary_get(db: Session, source: str, source_id: str):
-    return db.execute(
-        select(SpotSummary).where(
-            SpotSummary.source == source,
-            SpotSummary.source_id == source_id
+async def _summary_get(db: AsyncSession, source: str, source_id: str):
+    return (
+        await db.execute(
+            select(SpotSummary).where(
+                SpotSummary.source == source,
+                SpotSummary.source_id == source_id
+            )
         )
     ).scalar_one_or_none()
 
-def _summary_upsert(
-    db: Session, *, source: str, source_id: str, name: str, lat: float, lng: float,
+async def _summary_upsert(
+    db: AsyncSession, *, source: str, source_id: str, name: str, lat: float, lng: float,
     short_text: str | None, long_text: str | None, provider: str = "gemini-1.5-flash", lang: str = "ja",
-    tokens: int | None = None
+    tokens: int | None = None, commit: bool = True
 ):
-    row = _summary_get(db, source, source_id)
+    row = await _summary_get(db, source, source_id)
     if row is None:
         row = SpotSummary(
             source=source, source_id=source_id, name=name, lat=lat, lng=lng,
@@ -267,9 +290,132 @@ def _summary_upsert(
         row.provider = provider
         row.lang = lang
         row.tokens = tokens if tokens is not None else row.tokens
-    db.commit()
+        row.updated_at = func.now()  # MySQL 側（ON DUPLICATE KEY UPDATE）と同じく毎回更新
+    if commit:
+        await db.commit()
     return row
 
+async def _summary_get_many(db: AsyncSession, keys: List[tuple]) -> Dict[tuple, SpotSummary]:
+    """(source, source_id) の組をまとめて1回の IN クエリで引く"""
+    uniq = list(dict.fromkeys(keys))
+    if not uniq:
+        return {}
+    rows = (
+        await db.execute(
+            select(SpotSummary).where(tuple_(SpotSummary.source, SpotSummary.source_id).in_(uniq))
+        )
+    ).scalars().all()
+    return {(r.source, r.source_id): r for r in rows}
+
+async def _summary_upsert_many(db: AsyncSession, rows: List[dict]) -> None:
+    """
+    生成した要約をまとめて保存（commit は1回だけ）。
+    MySQL は INSERT ... ON DUPLICATE KEY UPDATE の1文で、それ以外（開発用SQLite等）は1件ずつ merge。
+    rows の各要素は _summary_upsert と同じキーワード引数の dict。
+    """
+    if not rows:
+        return
+    if db.get_bind().dialect.name == "mysql":
+        stmt = mysql_insert(SpotSummary).values([
+            {
+                "id": str(uuid.uuid4()),
+                "source": r["source"], "source_id": r["source_id"],
+                "name": r["name"], "lat": r["lat"], "lng": r["lng"],
+                "short_text_ja": r.get("short_text"), "long_text_ja": r.get("long_text"),
+                "provider": r.get("provider", "gemini-1.5-flash"), "lang": r.get("lang", "ja"),
+                "tokens": r.get("tokens"),
+            }
+            for r in rows
+        ])
+        new = stmt.inserted
+        # 既存が空なら更新（上書きしすぎない運用）は COALESCE で再現
+        stmt = stmt.on_duplicate_key_update(
+            short_text_ja=func.coalesce(new.short_text_ja, SpotSummary.short_text_ja),
+            long_text_ja=func.coalesce(new.long_text_ja, SpotSummary.long_text_ja),
+            provider=new.provider,
+            lang=new.lang,
+            tokens=func.coalesce(new.tokens, SpotSummary.tokens),
+            updated_at=func.now(),
+        )
+        await db.execute(stmt)
+    else:
+        for r in rows:
+            await _summary_upsert(db, commit=False, **r)
+    await db.commit()
+
+def _summary_key(source: str, source_id: str) -> str:
+    # /detour/summaries?ids= で使う公開ID（source_id 側に ":" が含まれても先頭で分割できる）
+    return f"{source}:{source_id}"
+
+def _summary_row(x: dict, source: str, source_id: str, g: dict) -> Optional[dict]:
+    """Gemini の結果を _summary_upsert_many 用の dict に。使えない結果なら None"""
+    if g.get("error") or not (g.get("short") or "").strip():
+        return None
+    return dict(
+        source=source, source_id=source_id,
+        name=x.get("name", ""),
+        lat=float(x["lat"]), lng=float(x["lng"]),
+        short_text=g.get("short"), long_text=g.get("long"),
+        provider="gemini-1.5-flash", lang="ja", tokens=g.get("tokens")
+    )
+
+async def _save_summaries(rows: List[dict]) -> None:
+    # バックグラウンド用：リクエストの Session とは別に開いて閉じる
+    async with AsyncSessionLocal() as db:
+        await _summary_upsert_many(db, rows)
+
+async def _mark_pending(db: AsyncSession, items: List[tuple]) -> None:
+    """積んだ分の空行を upsert して updated_at を今にする（他ワーカーにも pending と分かるように）"""
+    rows = [
+        dict(
+            source=source, source_id=source_id,
+            name=x.get("name", ""), lat=float(x["lat"]), lng=float(x["lng"]),
+            short_text=None, long_text=None,
+        )
+        for x, source, source_id in items
+    ]
+    try:
+        await _summary_upsert_many(db, rows)
+    except Exception as e:
+        # 印が付かなくても、このワーカーに来たポーリングはキューで pending と分かる
+        await db.rollback()
+        print("[DETOUR] marking summaries pending failed:", repr(e))
+
+def _is_recent(ts: Optional[datetime]) -> bool:
+    if ts is None:
+        return False
+    # guide_reuse と同じく UTC の naive で比べる
+    return (datetime.utcnow() - ts.replace(tzinfo=None)).total_seconds() < SUMMARY_PENDING_TTL
+
+def _enqueue_summary(x: dict, source: str, source_id: str) -> bool:
+    """説明文の生成→保存をバックグラウンドキューに積む（write-behind）"""
+    if not GEMINI_API_KEY:
+        return False  # 生成できないので積まない（フォールバック文のまま）
+    x = {k: x.get(k) for k in ("name", "address", "vicinity", "category", "lat", "lng")}
+
+    async def _job():
+        g = await _generate_summary(x)
+        row = _summary_row(x, source, source_id, g)
+        if row is None:
+            raise RuntimeError(g.get("error") or "empty summary")
+        await _save_summaries([row])
+
+    return _SUMMARY_QUEUE.submit((source, source_id), _job)
+
+async def _generate_summary(x: dict) -> dict:
+    """1件分の Gemini 要約。SUMMARY_DEADLINE を超えたらエラー扱いにしてフォールバックさせる"""
+    try:
+        return await asyncio.wait_for(
+            gemini_summarize_place(
+                name=x.get("name", ""),
+                address=x.get("address") or x.get("vicinity"),  # address / category が無ければ None でOK
+                category=x.get("category"),
+            ),
+            SUMMARY_DEADLINE,
+        )
+    except asyncio.TimeoutError:
+        return {"short": None, "long": None, "tokens": None, "error": f"timeout ({SUMMARY_DEADLINE}s)"}
+
 def _detect_source_id(x: dict) -> str:
     # 外部APIの形の違いを吸収：place_id / id / なければ座標ハッシュでフォールバック
     sid = x.get("place_id") or x.get("id")
@@ -293,7 +439,7 @@ async def search_detours(
     radius_m: Optional[int] = Query(None, ge=100, le=10000),
     local_only: bool = Query(False),    # 修正8/21: 非チェーンのみ抽出
     history_only: bool = Query(False),  # 追加8/21: DB履歴のみ
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     query = DetourSearchQuery(
         lat=lat,
@@ -310,11 +456,43 @@ async def search_detours(
     )
     return await search_detours_core(query, db)
 
+@router.get("/summaries", response_model=List[DetourSummary])
+async def get_detour_summaries(
+    ids: List[str] = Query(..., description="検索結果の summary_id（source:source_id）"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """バックグラウンド生成された説明文を後から取りに来る軽量API"""
+    ids = list(dict.fromkeys(ids))[:SUMMARY_IDS_MAX]
+    keys = []
+    for sid in ids:
+        source, sep, source_id = sid.partition(":")
+        if not sep or not source_id:
+            raise HTTPException(status_code=400, detail=f"invalid summary id: {sid}")
+        keys.append((source, source_id))
+
+    found = await _summary_get_many(db, keys)
+    out: List[DetourSummary] = []
+    for sid, k in zip(ids, keys):
+        row = found.get(k)
+        if row and row.short_text_ja:
+            status = "ready"
+        elif _SUMMARY_QUEUE.is_pending(k) or (row is not None and _is_recent(row.updated_at)):
+            status = "pending"
+        else:
+            status = "missing"
+        out.append(DetourSummary(
+            summary_id=sid,
+            status=status,
+            short_text=row.short_text_ja if row else None,
+            long_text=row.long_text_ja if row else None,
+        ))
+    return out
+
 @router.post("/choose", response_model=DetourHistoryItem)  # 追加8/21
 async def choose_detour(  # 追加8/21
     detour: DetourSuggestion,
     detour_type: DetourType = Query(...),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     rec = DetourHistory(
         detour_type=detour_type,
@@ -324,8 +502,8 @@ async def choose_detour(  # 追加8/21
         note=detour.description,
     )
     db.add(rec)
-    db.commit()           # 同期Sessionのため await 不要
-    db.refresh(rec)
+    await db.commit()     # AsyncSession なので await
+    await db.refresh(rec)
     return DetourHistoryItem(
         id=rec.id,
         detour_type=rec.detour_type,
@@ -339,9 +517,13 @@ async def choose_detour(  # 追加8/21
 # --- Step2: Gemini mini summarizer (append-only) -----------------------
 # --- Gemini mini summarizer (hardened) -----------------------------
 import os, json, httpx, re
+from app.services.http_client import get_client
+from app.core.timing import span
+from app.services.singleflight import SingleFlight
+from app.core.config import settings
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_API_KEY = settings.gemini_api_key
+GEMINI_MODEL = settings.gemini_model
 
 _GEMINI_SYSTEM = (
     "あなたは観光&グルメ案内のプロ編集者です。"
@@ -381,11 +563,20 @@ def _truncate(s: str, n: int) -> str:
     s = s.replace("\n", " ").strip()
     return s[:n]
 
+_GEMINI_FLIGHT = SingleFlight("gemini_summary")
+
 async def gemini_summarize_place(name: str, address: str | None = None, category: str | None = None) -> dict:
+    # 同じ店舗の要約が同時に要求されたら Gemini へは1回だけ
+    shared = await _GEMINI_FLIGHT.do(
+        (name, address, category), lambda: _gemini_summarize(name, address, category)
+    )
+    return dict(shared)
+
+async def _gemini_summarize(name: str, address: str | None, category: str | None) -> dict:
     if not GEMINI_API_KEY:
         return {"short": None, "long": None, "tokens": None, "error": "GEMINI_API_KEY not set"}
 
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
+    url = f"/v1beta/models/{GEMINI_MODEL}:generateContent?key={GEMINI_API_KEY}"
     payload = {
         "contents": [{
             "role": "user",
@@ -395,12 +586,13 @@ async def gemini_summarize_place(name: str, address: str | None = None, category
     }
 
     try:
-        async with httpx.AsyncClient(timeout=30) as client:
+        client = get_client("gemini")  # 共有クライアント（timeout=30 は http_client 側で設定）
+        with span("gemini"):
             r = await client.post(url, json=payload)
+            # 4xx/5xx/429 や候補なし（ブロック等）も span の中で上げて upstream_errors に数える
             r.raise_for_status()
             data = r.json()
-
-        raw = data["candidates"][0]["content"]["parts"][0]["text"]
+            raw = data["candidates"][0]["content"]["parts"][0]["text"]
         raw = raw.strip()
 
         # JSON抽出を頑強に
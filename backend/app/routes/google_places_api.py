@@ -1,7 +1,8 @@
 from fastapi import APIRouter, HTTPException, Query
+from app.core.timing import TimedRoute
 from app.services import google_places as svc
 
-router = APIRouter(prefix="/places", tags=["places"])
+router = APIRouter(prefix="/places", tags=["places"], route_class=TimedRoute)
 
 @router.get("/predictions")
 async def predictions(input: str = Query(..., min_length=1), limit: int = 3):
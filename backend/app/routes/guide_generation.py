@@ -1,35 +1,39 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.db.database import get_db
+from fastapi.responses import StreamingResponse
+from app.core.timing import TimedRoute
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from app.db.database import get_async_db
 from app.db import models
 from app.schemas.guide_content import GuideCreate, GuideRead
-from app.services import gpt, tts
+from app.services import tts, guide_stream, guide_reuse
 
-router = APIRouter(prefix="/guides", tags=["guides"])
+router = APIRouter(prefix="/guides", tags=["guides"], route_class=TimedRoute)
 
-@router.post("/", response_model=GuideRead, status_code=201)
-async def create_guide(payload: GuideCreate, db: Session = Depends(get_db)):
-    dest = db.get(models.Destination, payload.destinationId)
-    if not dest:
-        raise HTTPException(404, "Destination not found")
-
-    user_profile = None
-    if payload.userId:
-        user = db.get(models.User, payload.userId)  # ← あなたのUserモデルに合わせて
+async def _user_profile(db: AsyncSession, user_id: Optional[str]) -> Optional[dict]:
+    if user_id:
+        user = await db.get(models.User, user_id)  # ← あなたのUserモデルに合わせて
         if user:
-            user_profile = {
+            return {
                 "age": getattr(user, "age", None),
+                "age_group": getattr(user, "age_group", None),
                 "gender": getattr(user, "gender", None),
                 "interests": getattr(user, "interests", None),  # "神社,グルメ" など
             }
+    return None
+
+@router.post("/", response_model=GuideRead, status_code=201)
+async def create_guide(payload: GuideCreate, db: AsyncSession = Depends(get_async_db)):
+    dest = await db.get(models.Destination, payload.destinationId)
+    if not dest:
+        raise HTTPException(404, "Destination not found")
+
+    user_profile = await _user_profile(db, payload.userId)
 
-    text = await gpt.generate_guide_text(
-        name=dest.name,
-        address=dest.address,
-        lat=dest.lat,
-        lng=dest.lng,
+    text = await guide_reuse.get_or_generate(
+        dest,
         style=payload.style or "friendly",
-        user=user_profile,   # ★ パーソナライズ情報を渡す
+        user=user_profile,   # ★ パーソナライズ情報を渡す（セグメントが同じなら本文を使い回す）
     )
 
     _, audio_url = await tts.synthesize_to_mp3(text, payload.voice)
@@ -40,11 +44,28 @@ async def create_guide(payload: GuideCreate, db: Session = Depends(get_db)):
         voice=payload.voice,
         style=payload.style,
         audio_url=audio_url,
+        **guide_reuse.segment(user_profile),  # 使い回しはこのセグメント単位
     )
-    db.add(obj); db.commit(); db.refresh(obj)
+    db.add(obj); await db.commit(); await db.refresh(obj)
 
     return GuideRead(
         id=obj.id, destinationId=obj.destination_id, guideText=obj.guide_text,
         voice=obj.voice, style=obj.style, audioUrl=obj.audio_url,
         createdAt=obj.created_at
     )
+
+# create_guide の SSE 版（delta → audio → done）
+@router.post("/stream")
+async def create_guide_stream(payload: GuideCreate, db: AsyncSession = Depends(get_async_db)):
+    dest = await db.get(models.Destination, payload.destinationId)
+    if not dest:
+        raise HTTPException(404, "Destination not found")
+
+    user_profile = await _user_profile(db, payload.userId)
+    return StreamingResponse(
+        guide_stream.stream_guide(
+            dest, visit_id=None, style=payload.style or "friendly", voice=payload.voice, user=user_profile
+        ),
+        media_type="text/event-stream",
+        headers=guide_stream.SSE_HEADERS,
+    )
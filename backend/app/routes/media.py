@@ -0,0 +1,205 @@
+# app/routes/media.py
+# /media 配下（TTS の mp3 / フォールバックの txt）の配信。StaticFiles の代わりに使う。
+# - Range: bytes=... に 206 で応える（シークや再開で丸ごと取り直さない）
+# - ETag / Last-Modified と If-None-Match / If-Modified-Since で 304
+# - ファイル名がハッシュ（tts._audio_key）のものは中身が変わらないので Cache-Control: immutable
+# - mp3 は Accept: audio/ogg か ?format=ogg なら隣の .ogg（OGG_OPUS、数分の1のサイズ）を返す
+import email.utils
+import mimetypes
+import os
+import pathlib
+import re
+from typing import AsyncIterator, Optional, Tuple
+
+import anyio
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.timing import TimedRoute
+from app.services import media_store
+
+MEDIA_ROOT = media_store.MEDIA_ROOT
+MEDIA_IMMUTABLE_MAX_AGE = int(os.getenv("MEDIA_IMMUTABLE_MAX_AGE", str(365 * 24 * 3600)))
+# .ogg を求められたがまだ無くて mp3 を返す時の max-age。immutable にすると .ogg ができても取り直されない
+MEDIA_VARIANT_PENDING_MAX_AGE = int(os.getenv("MEDIA_VARIANT_PENDING_MAX_AGE", "60"))
+_CHUNK_SIZE = 64 * 1024
+
+# <sha256>.mp3 / <sha256>.first.mp3 など（tts.py の内容アドレス名。media_store で guides/ab/cd/ の下に置かれる）
+_HASHED_NAME = re.compile(r"^[0-9a-f]{64}(\.[a-z0-9]+)*$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+mimetypes.add_type("audio/mpeg", ".mp3")
+mimetypes.add_type("audio/ogg", ".ogg")
+
+router = APIRouter(prefix="/media", tags=["media"], route_class=TimedRoute)
+
+
+def _resolve(path: str) -> pathlib.Path:
+    """MEDIA_ROOT の外（../ など）は 404"""
+    target = (MEDIA_ROOT / path).resolve()
+    if not target.is_relative_to(MEDIA_ROOT) or not target.is_file():
+        raise HTTPException(404, "Not Found")
+    return target
+
+
+# mp3 の代わりに返せる別エンコード（tts.py が同じ名前で隣に作る）。?format= の値 → (拡張子, MIME)
+_VARIANTS = {"ogg": (".ogg", "audio/ogg"), "opus": (".ogg", "audio/ogg")}
+
+
+def _accepts(request: Request, mime: str) -> bool:
+    """Accept に mime が q>0 で明示されているか（*/* や audio/* だけでは選ばない）"""
+    for part in request.headers.get("accept", "").split(","):
+        kind, *params = [x.strip() for x in part.split(";")]
+        if kind.lower() != mime:
+            continue
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    return float(value) > 0
+                except ValueError:
+                    return False
+        return True
+    return False
+
+
+def _pick_variant(target: pathlib.Path, request: Request) -> Tuple[pathlib.Path, bool]:
+    """
+    ?format=ogg（mp3 で強制 mp3）か Accept: audio/ogg なら、あれば .ogg を返す。
+    2つ目は「別エンコードを求められたがまだ無いので mp3 で代用した」か。
+    """
+    if target.suffix != ".mp3" or target.name.endswith(".first.mp3"):
+        return target, False
+    fmt = (request.query_params.get("format") or "").lower()
+    if fmt == "mp3":
+        return target, False
+    variant = _VARIANTS.get(fmt)
+    if variant is None and not fmt:
+        variant = next((v for v in _VARIANTS.values() if _accepts(request, v[1])), None)
+    if variant is None:
+        return target, False
+    sibling = target.with_suffix(variant[0])
+    return (sibling, False) if sibling.is_file() else (target, True)
+
+
+def _etag(target: pathlib.Path, st: os.stat_result) -> str:
+    if _HASHED_NAME.match(target.name):
+        return f'"{target.name}"'  # ハッシュ名 = 中身（.first.mp3 などの別ファイルとも区別される）
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match は弱い比較（W/ を外して比べる）"""
+    if header.strip() == "*":
+        return True
+    tags = [t.strip() for t in header.split(",")]
+    return any(t.removeprefix("W/") == etag for t in tags)
+
+
+def _not_modified(request: Request, etag: str, mtime: float) -> bool:
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, etag)  # ある時は If-Modified-Since を見ない（RFC 9110）
+    ims = request.headers.get("if-modified-since")
+    if ims:
+        try:
+            return int(mtime) <= email.utils.parsedate_to_datetime(ims).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    単一範囲の bytes=a-b / a- / -n を (start, end) にする（end は含む）。
+    複数範囲や読めない指定は None（= 200 で全体を返す）、範囲外は ValueError（= 416）。
+    """
+    m = _RANGE.match(header.strip().replace(" ", ""))
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    first, last = m.group(1), m.group(2)
+    if not first:  # 末尾 n バイト
+        n = int(last)
+        if n == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - n), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
+
+
+def _if_range_ok(request: Request, etag: str, last_modified: str) -> bool:
+    """If-Range が現在のファイルと合わない時は Range を無視して全体を返す（強い比較）"""
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    return if_range == last_modified
+
+
+async def _iter_file(target: pathlib.Path, start: int, length: int) -> AsyncIterator[bytes]:
+    async with await anyio.open_file(target, "rb") as f:
+        await f.seek(start)
+        remaining = length
+        while remaining > 0:
+            chunk = await f.read(min(_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+@router.api_route("/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def serve_media(path: str, request: Request):
+    requested = _resolve(path)
+    target, variant_missing = _pick_variant(requested, request)
+    st = target.stat()
+    etag = _etag(target, st)
+    last_modified = email.utils.formatdate(st.st_mtime, usegmt=True)
+    media_type = mimetypes.guess_type(target.name)[0] or "application/octet-stream"
+    if media_type.startswith("text/"):
+        media_type += "; charset=utf-8"
+
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": (
+            f"public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable"
+            if _HASHED_NAME.match(target.name)
+            else "no-cache"  # フォールバックの txt など（毎回 304 で確認）
+        ),
+    }
+    if variant_missing:
+        # 代用の mp3 を長くキャッシュさせると、.ogg ができた後も同じ Accept ではずっと mp3 のままになる
+        headers["Cache-Control"] = f"public, max-age={MEDIA_VARIANT_PENDING_MAX_AGE}"
+    if requested.suffix == ".mp3" and not requested.name.endswith(".first.mp3"):
+        headers["Vary"] = "Accept"  # 同じ URL でも Accept で中身が変わる
+
+    media_store.touch(target)  # LRU の最終アクセス（反映はバックグラウンド）
+
+    if _not_modified(request, etag, st.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    size = st.st_size
+    start, end, status = 0, size - 1, 200
+    range_header = request.headers.get("range")
+    if range_header and size > 0 and _if_range_ok(request, etag, last_modified):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            status = 206
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1 if size > 0 else 0
+    headers["Content-Length"] = str(length)
+    if request.method == "HEAD":
+        return Response(status_code=status, headers=headers, media_type=media_type)
+    return StreamingResponse(_iter_file(target, start, length), status_code=status, headers=headers, media_type=media_type)
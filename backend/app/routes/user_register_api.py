@@ -1,11 +1,12 @@
 from fastapi import APIRouter, Depends, HTTPException
+from app.core.timing import TimedRoute
 from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from app.db.database import get_db
 from app.db import models
 from app.schemas.user_register import UserCreate
 
-router = APIRouter()
+router = APIRouter(route_class=TimedRoute)
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 @router.post("/register")
@@ -1,29 +1,32 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from app.core.timing import TimedRoute
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import IntegrityError
-from typing import Optional, Union
+from typing import Optional, Tuple, Union
 import traceback
 from typing import List
-from sqlalchemy import func
+from sqlalchemy import func, select
 from app.schemas.destination_schema import DestinationBrief
-from app.db.database import get_db
+from app.db.database import get_db, get_async_db
 from app.db import models
-from app.schemas.visit_record import VisitCreate, VisitRead
+from app.schemas.visit_record import VisitCreate, VisitRead, VisitJobRead
 from app.schemas.guide_content import GuideRead
-from app.services import gpt, tts
+from app.services import tts, guide_stream, guide_jobs, guide_reuse
 
-router = APIRouter(prefix="/visits", tags=["visits"])
+router = APIRouter(prefix="/visits", tags=["visits"], route_class=TimedRoute)
 
-def _get_destination_by_any(db: Session, destination_id: Union[int, str]) -> Optional[models.Destination]:
+async def _get_destination_by_any(db: AsyncSession, destination_id: Union[int, str]) -> Optional[models.Destination]:
     if isinstance(destination_id, int):
-        return db.query(models.Destination).filter(models.Destination.id == destination_id).first()
-    return db.query(models.Destination).filter(models.Destination.place_id == destination_id).first()
+        stmt = select(models.Destination).where(models.Destination.id == destination_id)
+    else:
+        stmt = select(models.Destination).where(models.Destination.place_id == destination_id)
+    return (await db.execute(stmt.limit(1))).scalars().first()
 
-@router.post("/", response_model=dict, status_code=201)
-async def create_visit(payload: VisitCreate, db: Session = Depends(get_db)):
-    print("DEBUG /visits payload.userId =", payload.userId)  # デバッグ用
+async def _insert_visit(db: AsyncSession, payload: VisitCreate) -> Tuple[models.Destination, models.VisitHistory]:
     # 1) 目的地取得
-    dest = _get_destination_by_any(db, payload.destinationId)
+    dest = await _get_destination_by_any(db, payload.destinationId)
     if not dest:
         raise HTTPException(status_code=404, detail="Destination not found")
 
@@ -31,38 +34,44 @@ async def create_visit(payload: VisitCreate, db: Session = Depends(get_db)):
     try:
         visit = models.VisitHistory(destination_id=dest.id, user_id=str(payload.userId) if payload.userId is not None else None)
         db.add(visit)
-        db.commit()
-        db.refresh(visit)
+        await db.commit()
+        await db.refresh(visit)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         print("Visit commit IntegrityError:", repr(e))
         traceback.print_exc()
         raise HTTPException(status_code=400, detail="Invalid visit values (FK/NOT NULL/unique)")  # 具体化
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print("Visit commit error:", repr(e))
         traceback.print_exc()
         raise
+    return dest, visit
 
+async def _user_profile(db: AsyncSession, user_id: Optional[Union[int, str]]) -> Optional[dict]:
     # 3) 任意: ユーザープロファイル
-    user_profile: Optional[dict] = None
-    if payload.userId and hasattr(models, "User"):
-        u = db.get(models.User, payload.userId)
+    if user_id and hasattr(models, "User"):
+        u = await db.get(models.User, user_id)
         if u:
-            user_profile = {
+            return {
                 "age": getattr(u, "age", None),
+                "age_group": getattr(u, "age_group", None),
                 "gender": getattr(u, "gender", None),
             }
+    return None
 
-    # 4) ガイド生成（失敗しても必ずフォールバック）
+@router.post("/", response_model=dict, status_code=201)
+async def create_visit(payload: VisitCreate, db: AsyncSession = Depends(get_async_db)):
+    print("DEBUG /visits payload.userId =", payload.userId)  # デバッグ用
+    dest, visit = await _insert_visit(db, payload)
+    user_profile = await _user_profile(db, payload.userId)
+
+    # 4) ガイド生成（同じ目的地×セグメントの新しめの本文があれば使い回す。失敗しても必ずフォールバック）
     try:
-        text = await gpt.generate_guide_text(
-            name=dest.name, address=dest.address, lat=dest.lat, lng=dest.lng,
-            style="friendly", user=user_profile
-        )
+        text = await guide_reuse.get_or_generate(dest, style="friendly", user=user_profile)
     except Exception as e:
         print("GPT guide error (fallback to plain text):", repr(e))
-        text = f"{dest.name}（{dest.address}）のご案内です。見どころ、歴史、アクセスをやさしく紹介します。"
+        text = guide_reuse.fallback_text(dest.name, dest.address)
 
     try:
         _, audio_url = await tts.synthesize_to_mp3(text, voice=None)
@@ -79,17 +88,18 @@ async def create_visit(payload: VisitCreate, db: Session = Depends(get_db)):
             voice="",                 # ← None で NOT NULL だと落ちる対策
             style="friendly",
             audio_url=audio_url or "",# ← 念のため
+            **guide_reuse.segment(user_profile),
         )
         db.add(guide)
-        db.commit()
-        db.refresh(guide)
+        await db.commit()
+        await db.refresh(guide)
     except IntegrityError as e:
-        db.rollback()
+        await db.rollback()
         print("Guide commit IntegrityError:", repr(e))
         traceback.print_exc()
         raise HTTPException(status_code=400, detail="Invalid guide values (FK/NOT NULL/length)")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print("Guide commit error:", repr(e))
         traceback.print_exc()
         raise
@@ -111,6 +121,69 @@ async def create_visit(payload: VisitCreate, db: Session = Depends(get_db)):
 
     return {"visit": visit_out, "guide": guide_out}
 
+# create_visit の SSE 版: 本文を生成しながら delta イベントで流し、最後に guide_id / audio_url を done で返す
+@router.post("/stream")
+async def create_visit_stream(payload: VisitCreate, db: AsyncSession = Depends(get_async_db)):
+    dest, visit = await _insert_visit(db, payload)
+    user_profile = await _user_profile(db, payload.userId)
+    return StreamingResponse(
+        guide_stream.stream_guide(dest, visit_id=visit.id, style="friendly", voice=None, user=user_profile),
+        media_type="text/event-stream",
+        headers=guide_stream.SSE_HEADERS,
+    )
+
+# ジョブ版: Visit を保存したら 202 で job_id を返し、ガイド生成はワーカーに任せる
+@router.post("/jobs", status_code=202)
+async def create_visit_job(payload: VisitCreate, db: AsyncSession = Depends(get_async_db)):
+    # 満杯なら Visit を保存する前に断る（保存してから 503 だと、リトライのたびに Visit が増える）
+    if not guide_jobs.has_capacity():
+        raise HTTPException(status_code=503, detail="Guide generation is busy, retry later")
+    dest, visit = await _insert_visit(db, payload)
+    user_profile = await _user_profile(db, payload.userId)
+    try:
+        job = await guide_jobs.submit_guide_job(dest, visit_id=visit.id, user=user_profile)
+    except guide_jobs.QueueFull:
+        # 確認してから保存するまでの間に埋まった。ガイドの無い Visit を残さないよう消してから断る
+        try:
+            await db.delete(visit)
+            await db.commit()
+        except Exception as e:
+            await db.rollback()
+            print("Visit rollback after QueueFull failed:", repr(e))
+        raise HTTPException(status_code=503, detail="Guide generation is busy, retry later")
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "visit": VisitRead.model_validate(visit),
+        "status_url": f"/visits/jobs/{job.id}",
+        "events_url": f"/visits/jobs/{job.id}/events",
+    }
+
+# 状態は guide_jobs テーブルから読む（ジョブを積んだのと別のワーカーに来ても答えられる）
+@router.get("/jobs/{job_id}", response_model=VisitJobRead)
+async def get_visit_job(job_id: str):
+    job = await guide_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# 完了を SSE で待つ（keepalive コメントを挟み、done / failed を1回送って閉じる）
+@router.get("/jobs/{job_id}/events")
+async def visit_job_events(job_id: str):
+    job = await guide_jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def _events():
+        current = job
+        while current["status"] not in guide_jobs.FINISHED:
+            current = await guide_jobs.wait_job(job_id, timeout=15) or current
+            if current["status"] not in guide_jobs.FINISHED:
+                yield ": keepalive\n\n"
+        yield guide_stream.sse(current["status"], VisitJobRead(**current).model_dump(mode="json"))
+
+    return StreamingResponse(_events(), media_type="text/event-stream", headers=guide_stream.SSE_HEADERS)
+
 # 7) 最近の訪問先一覧（placeId と name のみ）取得
 @router.get("/recent", response_model=List[DestinationBrief])
 def get_recent_destinations(user_id: str, limit: int = 5, db: Session = Depends(get_db)):
@@ -52,10 +52,19 @@ class DetourSuggestion(BaseModel):
     photo_url: Optional[str] = None
     created_at: Optional[str] = None      # DBの登録日時（レスポンス用）
     categories: List[str] = Field(default_factory=list)  # ← 追加（検索語/分類の表示）
+    summary_id: Optional[str] = None      # 説明文の後追い取得用ID（/detour/summaries?ids=）
+    summary_pending: bool = False         # True: description はフォールバック文で、生成は裏で進行中
 
     # Pydantic v2: ORMオブジェクトからの属性取り出しを許可
     model_config = ConfigDict(from_attributes=True)  # 修正8/21
 
+# 📝 説明文（バックグラウンド生成分の後追い取得用）
+class DetourSummary(BaseModel):
+    summary_id: str
+    status: Literal["ready", "pending", "missing"]
+    short_text: Optional[str] = None
+    long_text: Optional[str] = None
+
 # 🕓 履歴アイテム
 class DetourHistoryItem(BaseModel):
     id: int
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, Union
+from typing import Literal, Optional, Union
 from datetime import datetime
 
 class VisitCreate(BaseModel):
@@ -17,3 +17,14 @@ class VisitRead(BaseModel):
     # ← ユーザーIDの型が未定なら Union に
     userId: Optional[Union[int, str]] = Field(default=None, alias="user_id")
     createdAt: datetime = Field(alias="created_at")
+
+class VisitJobRead(BaseModel):
+    # POST /visits/jobs で積んだガイド生成ジョブの状態
+    job_id: str
+    status: Literal["queued", "running", "done", "failed"]
+    visit_id: str
+    guide_id: Optional[str] = None
+    audio_url: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
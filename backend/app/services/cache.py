@@ -0,0 +1,139 @@
+# app/services/cache.py
+# プロセス内の小さな非同期キャッシュ（LRU + TTL + stale-while-revalidate）。
+# 外部APIの結果を短時間使い回して、課金と待ち時間を減らすために使う。
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from app.core.metrics import CACHE_LOOKUPS
+
+# name → キャッシュ（/__cache_stats で一覧表示する）
+_REGISTRY: Dict[str, "TTLCache"] = {}
+
+
+class _Entry:
+    __slots__ = ("value", "fresh_until", "stale_until")
+
+    def __init__(self, value: Any, fresh_until: float, stale_until: float):
+        self.value = value
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+
+
+class TTLCache:
+    """
+    - maxsize を超えたら最も使われていないキーから捨てる（LRU）
+    - ttl 秒までは fresh としてそのまま返す
+    - そこから stale_ttl 秒までは古い値を即返しつつ、裏で1回だけ再取得する
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float, stale_ttl: float = 0.0):
+        self.name = name
+        self.maxsize = max(1, maxsize)
+        self.ttl = ttl
+        self.stale_ttl = max(0.0, stale_ttl)
+        self._data: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refresh_errors = 0
+        _REGISTRY[name] = self
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """fresh な値だけ返す（統計は数えない）"""
+        entry = self._data.get(key)
+        if entry is None or time.monotonic() >= entry.fresh_until:
+            return None
+        return entry.value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        """ttl を渡すとこのキーだけ既定の ttl の代わりに使う"""
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        self._data[key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        キャッシュから取得し、無ければ loader() で取得して保存する。
+        loader が例外を投げた場合は保存せずそのまま送出する。
+        """
+        now = time.monotonic()
+        entry = self._data.get(key)
+        if entry is not None:
+            if now < entry.fresh_until:
+                self.hits += 1
+                CACHE_LOOKUPS.labels(self.name, "hit").inc()
+                self._data.move_to_end(key)
+                return entry.value
+            if now < entry.stale_until:
+                self.stale_hits += 1
+                CACHE_LOOKUPS.labels(self.name, "stale").inc()
+                self._data.move_to_end(key)
+                self._schedule_refresh(key, loader)
+                return entry.value
+            self._data.pop(key, None)
+
+        self.misses += 1
+        CACHE_LOOKUPS.labels(self.name, "miss").inc()
+        value = await loader()
+        self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+
+        async def _refresh():
+            try:
+                self.set(key, await loader())
+            except Exception as e:
+                # 失敗しても stale な値は残しておく（次のアクセスで再挑戦）
+                self.refresh_errors += 1
+                print(f"[CACHE] {self.name} refresh failed key={key!r}: {e!r}")
+            finally:
+                self._refreshing.discard(key)
+
+        task = asyncio.create_task(_refresh())
+        self._tasks.add(task)  # GC で消えないよう参照を保持
+        task.add_done_callback(self._tasks.discard)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "refresh_errors": self.refresh_errors,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else None,
+        }
+
+
+def cache_stats() -> Dict[str, dict]:
+    """登録済みキャッシュ全部の統計"""
+    return {name: c.stats() for name, c in _REGISTRY.items()}
+
+
+def clear_all() -> None:
+    """登録済みキャッシュを全部空にする（bench/ でシナリオごとにコールドから測る時など）"""
+    for c in _REGISTRY.values():
+        c.clear()
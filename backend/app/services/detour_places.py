@@ -1,12 +1,13 @@
 # app/services/detour_places.py
 
-import os
-import httpx
 from typing import List, Optional
 from app.schemas.detour import DetourSuggestion, TravelMode, DetourType
+from app.services.http_client import get_client
+from app.core.config import settings
+from app.core.timing import span
 
-GOOGLE_PLACES_API_KEY = os.getenv("GOOGLE_PLACES_API_KEY")
-BASE_URL = "https://maps.googleapis.com/maps/api/place/nearbysearch/json"
+GOOGLE_PLACES_API_KEY = settings.google_places_api_key
+BASE_URL = "/maps/api/place/nearbysearch/json"
 
 def minutes_to_distance_km(minutes: int, mode: TravelMode) -> float:
     speed_kmh = 4.5 if mode == "walk" else 40.0
@@ -42,9 +43,10 @@ async def search_detour_places(
         "keyword": keyword
     }
 
-    async with httpx.AsyncClient() as client:
+    client = get_client("google")
+    with span("google_places"):
         resp = await client.get(BASE_URL, params=params)
-        data = resp.json()
+    data = resp.json()
 
     suggestions = []
     for place in data.get("results", []):
@@ -1,19 +1,23 @@
 # backend/app/services/events.py
-from dotenv import load_dotenv
-load_dotenv()
-
 print(f"[WIRE] events.py loaded: {__file__}")  # ★どのファイルが実際に使われているか表示
 
 import os
-import httpx
+import asyncio
 import datetime as dt
 import re
 import unicodedata  # ★ 追加
 from typing import List, Dict, Optional, Union
 from .geo import haversine_km, minutes_to_radius_km
+from .http_client import get_client
+from app.core.config import settings
+from app.core.timing import span
+from .singleflight import SingleFlight
 
 # ==== 設定 ====
-YOLP_APP_ID = os.getenv("YOLP_APP_ID")
+YOLP_APP_ID = settings.yolp_app_id
+YOLP_CONCURRENCY = int(os.getenv("YOLP_CONCURRENCY", "4"))    # キーワード並列数
+YOLP_DEADLINE = float(os.getenv("YOLP_DEADLINE", "6"))        # 検索全体の締め切り（秒）
+_EVENTS_FLIGHT = SingleFlight("yolp_events")
 
 # チェーン除外（必要に応じて拡張）
 _CHAIN = r"(すき家|マクドナルド|吉野家|ガスト|コメダ|スタバ|ドトール|セブンイレブン|ローソン|ファミリーマート|サイゼリヤ|丸亀製麺|びっくりドンキー|ココイチ|はま寿司|スシロー|ユニクロ)"
@@ -75,12 +79,12 @@ def _seed_keywords(keyword: Optional[str], categories: Optional[List[str]]) -> L
 # ==== 逆ジオコーディング（残置・任意利用） ====
 async def reverse_geocode_city(lat: float, lng: float) -> Optional[str]:
     """Nominatimで市区町村名を取得（必要ならキーワードに追加して使える）"""
-    url = "https://nominatim.openstreetmap.org/reverse"
+    url = "/reverse"
     params = {"format": "jsonv2", "lat": lat, "lon": lng}
-    headers = {"User-Agent": "SerendiGo/1.0"}
-    async with httpx.AsyncClient(timeout=10, headers=headers) as client:
+    client = get_client("nominatim")  # User-Agent は共有クライアント側で付与
+    with span("nominatim"):
         r = await client.get(url, params=params)
-        j = r.json()
+    j = r.json()
     addr = j.get("address", {})
     return addr.get("city") or addr.get("town") or addr.get("village") or addr.get("municipality")
 
@@ -100,6 +104,25 @@ async def connpass_events(  # ← 既存の関数名を維持（中身はYOLP）
     ※ 開催日時は取得できない前提（施設・催事名ベース）
     戻り値: {id,name,description,lat,lng,url,address,categories,source="yolp"} の配列
     """
+    # 同条件の検索が同時に来たら YOLP へは1回だけ（single-flight）
+    mode_key = (mode.value if hasattr(mode, "value") else mode) or "walk"
+    key = (lat, lng, minutes, keyword, tuple(categories or ()), local_only, mode_key)
+    shared = await _EVENTS_FLIGHT.do(
+        key, lambda: _search_events(lat, lng, minutes, keyword, categories, local_only, mode)
+    )
+    # 呼び出し側が distance_km などを書き足すのでコピーして返す
+    return [dict(it) for it in shared]
+
+
+async def _search_events(
+    lat: float,
+    lng: float,
+    minutes: int,
+    keyword: Optional[str],
+    categories: Optional[List[str]],
+    local_only: bool,
+    mode: Union[str, None],
+) -> List[Dict]:
     if not YOLP_APP_ID:
         print("[YOLP] APP_ID missing -> return []")  # ★ログ
 
@@ -113,108 +136,136 @@ async def connpass_events(  # ← 既存の関数名を維持（中身はYOLP）
     queries = _seed_keywords(keyword, categories)
     print(f"[YOLP] queries={queries} radius_km={radius_km:.2f} lat={lat} lng={lng} mode={mode_str}")  # ★ログ
 
-    base = "https://map.yahooapis.jp/search/local/V1/localSearch"
+    base = "/search/local/V1/localSearch"
 
     items: List[Dict] = []
-    async with httpx.AsyncClient(timeout=10) as client:
-        for q in queries:
-            params = {
-                "appid": YOLP_APP_ID,
-                "lat": lat,
-                "lon": lng,
-                "dist": max(0.5, min(radius_km, 20.0)),  # km, 0.5〜20に丸め
-                "query": q,
-                "sort": "dist",
-                "results": 50,
-                "output": "json",          # ★ これが超重要（デフォはXML）
-            }
-            try:
-                r = await client.get(base, params=params)
-                r.raise_for_status()
-                data = r.json()
-            except Exception as ex:
-                print(f"[YOLP] request error q={q} ex={ex!r}")
+    client = get_client("yolp")  # 共有クライアント（lifespanで生成）
+    sem = asyncio.Semaphore(max(1, YOLP_CONCURRENCY))
+
+    async def _query(q: str):
+        """1キーワード分の localSearch。失敗時は (q, None) を返す"""
+        params = {
+            "appid": YOLP_APP_ID,
+            "lat": lat,
+            "lon": lng,
+            "dist": max(0.5, min(radius_km, 20.0)),  # km, 0.5〜20に丸め
+            "query": q,
+            "sort": "dist",
+            "results": 50,
+            "output": "json",          # ★ これが超重要（デフォはXML）
+        }
+        try:
+            async with sem:
+                with span("yolp"):
+                    r = await client.get(base, params=params)
+                    r.raise_for_status()  # 4xx/5xx も span の中で上げて upstream_errors に数える
+                    data = r.json()
+        except Exception as ex:
+            print(f"[YOLP] request error q={q} ex={ex!r}")
+            return q, None
+        return q, (data.get("Feature") or [])
+
+    # キーワードを並列に投げて結果を集める（全体に締め切りを設ける）
+    fetched: Dict[str, List[Dict]] = {}
+    tasks = [asyncio.create_task(_query(q)) for q in queries]
+    try:
+        for fut in asyncio.as_completed(tasks, timeout=YOLP_DEADLINE):
+            q, feats = await fut
+            if feats is not None:
+                fetched[q] = feats
+                print(f"[YOLP] q={q} hits={len(feats)}")  # ログ
+    except asyncio.TimeoutError:
+        pending = sum(1 for t in tasks if not t.done())
+        print(f"[YOLP] deadline {YOLP_DEADLINE}s exceeded -> {pending} queries dropped")
+    finally:
+        for t in tasks:
+            if not t.done():
+                t.cancel()
+
+    # マージは返ってきた順ではなく queries の順で（同じ POI が複数キーワードに出た時、
+    # 重複除去で残るもの＝categories[0] が通信のタイミングで変わらないように）
+    for q in queries:
+        feats = fetched.get(q)
+        if feats is None:
+            continue
+        for f in feats:
+            # 置き換え：正規化してからフィルタ判定
+            name_raw = (f.get("Name") or "").strip()
+            name = unicodedata.normalize("NFKC", name_raw)  # ㈱/（ ）等を半角の(株)等に正規化
+            if not name:
                 continue
 
+            # 1) 会社・業務系ワードを除外
+            if _CORP.search(name) or _is_chain(name):
+                # print(f"[YOLP] drop(corp): {name}")
+                continue
+            if local_only and _is_chain(name):
+                # print(f"[YOLP] drop(chain): {name}")
+                continue
 
-            feats = data.get("Feature") or []
-            print(f"[YOLP] q={q} hits={len(feats)}")  # ログ
-
-            for f in feats:
-                # 置き換え：正規化してからフィルタ判定
-                name_raw = (f.get("Name") or "").strip()
-                name = unicodedata.normalize("NFKC", name_raw)  # ㈱/（ ）等を半角の(株)等に正規化
-                if not name:
-                    continue
-
-                # 1) 会社・業務系ワードを除外
-                if _CORP.search(name) or _is_chain(name):
-                    # print(f"[YOLP] drop(corp): {name}")
-                    continue
-                if local_only and _is_chain(name):
-                    # print(f"[YOLP] drop(chain): {name}")
+            # 2) 座標抽出
+            coords = (f.get("Geometry") or {}).get("Coordinates") or ""
+            if "," not in coords:
+                continue
+            lng2_s, lat2_s = coords.split(",", 1)
+            try:
+                lat2 = float(lat2_s)
+                lng2 = float(lng2_s)
+            except ValueError:
+                # 念のため
+                parts = coords.split(",")
+                if len(parts) != 2:
                     continue
+                lng2 = float(parts[0]); lat2 = float(parts[1])
 
-                # 2) 座標抽出
-                coords = (f.get("Geometry") or {}).get("Coordinates") or ""
-                if "," not in coords:
-                    continue
-                lng2_s, lat2_s = coords.split(",", 1)
-                try:
-                    lat2 = float(lat2_s)
-                    lng2 = float(lng2_s)
-                except ValueError:
-                    # 念のため
-                    parts = coords.split(",")
-                    if len(parts) != 2:
-                        continue
-                    lng2 = float(parts[0]); lat2 = float(parts[1])
-
-                d_km = haversine_km(lat, lng, lat2, lng2)
-                if d_km > radius_km + 0.2:
-                    continue
+            d_km = haversine_km(lat, lng, lat2, lng2)
+            if d_km > radius_km + 0.2:
+                continue
 
-                # 3) ジャンル名や説明文を抽出してイベント語判定に使う
-                prop = f.get("Property") or {}
-                genres_raw = prop.get("Genre") or []
-                genre_names: List[str] = []
-                if isinstance(genres_raw, list):
-                    for g in genres_raw:
-                        if isinstance(g, dict):
-                            n = (g.get("Name") or "").strip()
-                            if n: genre_names.append(n)
-                        else:
-                            n = str(g).strip()
-                            if n: genre_names.append(n)
-                elif isinstance(genres_raw, dict):
-                    n = (genres_raw.get("Name") or "").strip()
-                    if n: genre_names.append(n)
-
-                # CatchCopy/Lead などの短文もイベント語検出に使う
-                catch = (prop.get("CatchCopy") or "")
-                lead  = (prop.get("Lead") or "")
-
-                # イベント語を “単語っぽく” 判定（フェスタは除外）
-                haystack = " ".join([name, " ".join(genre_names), catch, lead])
-                if not _EVENT_PAT.search(haystack):
-                    continue
+            # 3) ジャンル名や説明文を抽出してイベント語判定に使う
+            prop = f.get("Property") or {}
+            genres_raw = prop.get("Genre") or []
+            genre_names: List[str] = []
+            if isinstance(genres_raw, list):
+                for g in genres_raw:
+                    if isinstance(g, dict):
+                        n = (g.get("Name") or "").strip()
+                        if n: genre_names.append(n)
+                    else:
+                        n = str(g).strip()
+                        if n: genre_names.append(n)
+            elif isinstance(genres_raw, dict):
+                n = (genres_raw.get("Name") or "").strip()
+                if n: genre_names.append(n)
+
+            # CatchCopy/Lead などの短文もイベント語検出に使う
+            catch = (prop.get("CatchCopy") or "")
+            lead  = (prop.get("Lead") or "")
+
+            # イベント語を “単語っぽく” 判定（フェスタは除外）
+            haystack = " ".join([name, " ".join(genre_names), catch, lead])
+            if not _EVENT_PAT.search(haystack):
+                continue
 
 
-                # 5) 合格：アイテム化
-                items.append({
-                    "id": f.get("Id") or f"{round(lat2,6)},{round(lng2,6)}:{name}",
-                    "name": name,
-                    "description": catch or "",
-                    "lat": lat2,
-                    "lng": lng2,
-                    "address": prop.get("Address"),
-                    "url": (prop.get("Detail") or {}).get("PcUrl"),
-                    "categories": [q] + (genre_names[:3] if genre_names else []),  # ← ジャンル名も混ぜる
-                    "source": "yolp",
-                })
+            # 5) 合格：アイテム化
+            items.append({
+                "id": f.get("Id") or f"{round(lat2,6)},{round(lng2,6)}:{name}",
+                "name": name,
+                "description": catch or "",
+                "lat": lat2,
+                "lng": lng2,
+                "address": prop.get("Address"),
+                "url": (prop.get("Detail") or {}).get("PcUrl"),
+                "categories": [q] + (genre_names[:3] if genre_names else []),  # ← ジャンル名も混ぜる
+                "source": "yolp",
+            })
 
     # 重複除去の直前あたりに追加
-    if not items:
+    if not items and fetched:
+        # 救済は従来どおり「最後のキーワード」の結果で行う（seed順で最後に取れたもの）
+        q = next(x for x in reversed(queries) if x in fetched)
+        feats = fetched[q]
         # 救済：会社ワードだけ除外して、イベント語チェックは緩める
         for f in feats:
             name = (f.get("Name") or "").strip()
@@ -1,14 +1,38 @@
 # app/services/places.py
-from dotenv import load_dotenv
-load_dotenv() # .env ファイルから環境変数を読み込む
+import datetime as dt
 import os
-import httpx
+from typing import Optional
+from sqlalchemy import select, update
+from app.core.config import settings
+from app.core.metrics import CACHE_LOOKUPS
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services.cache import TTLCache
+from app.services.http_client import get_client
+from app.core.timing import span
+from app.services.singleflight import SingleFlight
 
-USE = os.getenv("USE_GOOGLE_PLACES", "false").lower() == "true"
-KEY = os.getenv("GOOGLE_MAPS_API_KEY") or ""
+USE = settings.use_google_places
+KEY = settings.google_maps_api_key
 REGION = os.getenv("GOOGLE_PLACES_REGION", "jp")
 LANG = os.getenv("GOOGLE_PLACES_LANGUAGE", "ja")
 
+# Details は プロセス内 LRU → destinations テーブル → Google の順に引く（read-through）
+# destinations の行が PLACES_DETAILS_MAX_AGE_DAYS より古ければ Google で取り直して行も更新する（0 = 期限なし）
+PLACES_DETAILS_MAX_AGE = float(os.getenv("PLACES_DETAILS_MAX_AGE_DAYS", "30")) * 86400
+# 取得するのは destinations に保存する項目だけ（types や viewport は使っていない）
+DETAILS_FIELDS = "place_id,name,formatted_address,geometry/location"
+
+# Google が失敗して古い行で代用した時は、LRU にこの秒数だけ置いて早めに取り直す
+PLACES_DETAILS_STALE_CACHE_TTL = float(os.getenv("PLACES_DETAILS_STALE_CACHE_TTL", "300"))
+
+_DETAILS_FLIGHT = SingleFlight("places_details")
+_DETAILS_CACHE = TTLCache(
+    "places_details",
+    maxsize=int(os.getenv("PLACES_DETAILS_CACHE_SIZE", "4096")),
+    ttl=float(os.getenv("PLACES_DETAILS_CACHE_TTL", "86400")),  # 1日
+)
+
 
 def _need_key():
     if not KEY:
@@ -19,7 +43,7 @@ async def predictions(input: str, limit: int = 3):
         return MOCK_PREDS[:limit]
 
     _need_key()
-    url = "https://maps.googleapis.com/maps/api/place/autocomplete/json"
+    url = "/maps/api/place/autocomplete/json"
     params = {
         "input": input,
         "key": KEY,
@@ -28,50 +52,121 @@ async def predictions(input: str, limit: int = 3):
         # "types": "geocode",  # 施設に限定したい場合は有効化
     }
 
-    async with httpx.AsyncClient(timeout=10) as cli:
+    cli = get_client("google")  # 共有クライアント（lifespanで生成）
+    # HTTP エラーと status のエラーも span の中で上げて、upstream_errors に数える
+    with span("google_places"):
         r = await cli.get(url, params=params)
         r.raise_for_status()
         data = r.json()
         status = data.get("status")
+        if status not in ("OK", "ZERO_RESULTS"):
+            raise RuntimeError(f"Places Autocomplete error: {data.get('error_message', status)}")
+
+    if status == "OK":
+        out = []
+        # 上限は念のため 3 に丸めておく
+        topn = max(0, min(limit, 3))
+        for p in data.get("predictions", [])[:topn]:
+            out.append({
+                "description": p.get("description"),
+                "place_id": p.get("place_id"),
+                "structured_formatting": p.get("structured_formatting", {}),
+            })
+        return out
 
-        if status == "OK":
-            out = []
-            # 上限は念のため 3 に丸めておく
-            topn = max(0, min(limit, 3))
-            for p in data.get("predictions", [])[:topn]:
-                out.append({
-                    "description": p.get("description"),
-                    "place_id": p.get("place_id"),
-                    "structured_formatting": p.get("structured_formatting", {}),
-                })
-            return out
+    return []  # ZERO_RESULTS
 
-        if status == "ZERO_RESULTS":
-            return []
+class _StaleDetails(Exception):
+    """Google が失敗したので古い destinations の行で代用した（get_or_load に既定の TTL で保存させないため例外で返す）"""
 
-        # それ以外はエラーメッセージを表に出す
-        raise RuntimeError(f"Places Autocomplete error: {data.get('error_message', status)}")
+    def __init__(self, data: dict):
+        super().__init__("serving stale destination row")
+        self.data = data
 
 async def details(place_id: str):
     if not USE:
         return MOCK_DETAIL
 
-    _need_key()
-    url = "https://maps.googleapis.com/maps/api/place/details/json"
+    try:
+        return await _DETAILS_CACHE.get_or_load(place_id, lambda: _load_details(place_id))
+    except _StaleDetails as e:
+        _DETAILS_CACHE.set(place_id, e.data, ttl=PLACES_DETAILS_STALE_CACHE_TTL)
+        return e.data
+
+def _from_row(row: models.Destination) -> dict:
+    """destinations の行を Details API の result と同じ形にする"""
+    return {
+        "place_id": row.place_id,
+        "name": row.name,
+        "formatted_address": row.address,
+        "geometry": {"location": {"lat": row.lat, "lng": row.lng}},
+    }
+
+def _is_fresh(row: models.Destination) -> bool:
+    fetched_at = row.details_fetched_at or row.created_at  # 取り直したことが無ければ登録時のもの
+    if PLACES_DETAILS_MAX_AGE <= 0 or fetched_at is None:
+        return True
+    fetched_at = fetched_at.replace(tzinfo=None)  # guide_reuse と同じく UTC の naive で比べる
+    return dt.datetime.utcnow() - fetched_at < dt.timedelta(seconds=PLACES_DETAILS_MAX_AGE)
+
+async def _load_details(place_id: str) -> dict:
+    async with AsyncSessionLocal() as db:
+        row: Optional[models.Destination] = (
+            await db.execute(select(models.Destination).where(models.Destination.place_id == place_id))
+        ).scalars().first()
+    if row is not None and _is_fresh(row):
+        CACHE_LOOKUPS.labels("places_details_db", "hit").inc()
+        return _from_row(row)
+    CACHE_LOOKUPS.labels("places_details_db", "stale" if row is not None else "miss").inc()
+
+    try:
+        _need_key()
+        # 同じ place_id の同時リクエストは1本にまとめる
+        data = await _DETAILS_FLIGHT.do(place_id, lambda: _fetch_details(place_id))
+    except Exception as e:
+        if row is None:
+            raise
+        # 古くても行があれば返す（Google の障害 / クォータ切れで Details 全体を落とさない）
+        print("Places details refresh failed (serving stale row):", repr(e))
+        raise _StaleDetails(_from_row(row)) from e
+    if row is not None and data and "location" in (data.get("geometry") or {}):
+        await _refresh_row(place_id, data)
+    return data
+
+async def _refresh_row(place_id: str, data: dict) -> None:
+    """古くなった destinations の行を取り直した内容で上書きする（失敗しても取得結果は返す）"""
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.Destination)
+                .where(models.Destination.place_id == place_id)
+                .values(
+                    name=data.get("name", ""),
+                    address=data.get("formatted_address", ""),
+                    lat=data["geometry"]["location"]["lat"],
+                    lng=data["geometry"]["location"]["lng"],
+                    details_fetched_at=dt.datetime.utcnow(),
+                )
+            )
+            await db.commit()
+    except Exception as e:
+        print("Places details row refresh failed:", repr(e))
+
+async def _fetch_details(place_id: str):
+    url = "/maps/api/place/details/json"
     params = {
         "place_id": place_id,
         "key": KEY,
         "language": LANG,
-        "fields": "place_id,name,formatted_address,geometry,types",
+        "fields": DETAILS_FIELDS,
     }
 
-    async with httpx.AsyncClient(timeout=10) as cli:
+    cli = get_client("google")  # 共有クライアント（lifespanで生成）
+    with span("google_places"):
         r = await cli.get(url, params=params)
         r.raise_for_status()
         data = r.json()
         status = data.get("status")
-
-        if status == "OK":
-            return data.get("result")
-
-        raise RuntimeError(f"Places Details error: {data.get('error_message', status)}")
+        if status != "OK":
+            raise RuntimeError(f"Places Details error: {data.get('error_message', status)}")
+    return data.get("result")
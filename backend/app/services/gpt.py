@@ -1,17 +1,44 @@
 # app/services/gpt.py
+# openai SDK は import が重いので、最初の生成時に読み込む（起動を速くするため）
+import asyncio
 import os
-from typing import Optional, Dict, Any
-from openai import OpenAI
-from anyio import to_thread  # 同期APIを非ブロッキングで呼ぶため
+import random
+import threading
+from typing import TYPE_CHECKING, AsyncIterator, Optional, Dict, Any
+from app.core.config import settings
+from app.core.metrics import OPENAI_RETRIES, OPENAI_TOKENS
+from app.core.timing import span
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
 
 # ---- 設定 ----
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if not OPENAI_API_KEY:
-    raise RuntimeError("OPENAI_API_KEY が設定されていません。.env を確認してください。")
+MODEL_TEXT = settings.openai_text_model  # 必要なら .env で上書き可
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))                  # 1リクエストの上限（秒）
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "8"))     # 同時に投げる生成の数
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))             # 429 / 5xx / 接続失敗時の再試行回数
+OPENAI_RETRY_BASE = float(os.getenv("OPENAI_RETRY_BASE", "0.5"))           # バックオフの初期値（秒）
+OPENAI_RETRY_MAX = float(os.getenv("OPENAI_RETRY_MAX", "8"))               # バックオフの上限（秒）
+
+_client: "AsyncOpenAI | None" = None
+_client_lock = threading.Lock()
+# スレッドプールを使わないので、同時実行数はここで絞る（超えた分はイベントループ上で待つ）
+_SEM = asyncio.Semaphore(max(1, OPENAI_MAX_CONCURRENCY))
 
-MODEL_TEXT = os.getenv("OPENAI_TEXT_MODEL", "gpt-4o-mini")  # 必要なら .env で上書き可
 
-client = OpenAI(api_key=OPENAI_API_KEY)
+def get_client() -> "AsyncOpenAI":
+    """初回呼び出し時に生成（鍵が無ければここで RuntimeError。呼び出し側のフォールバックに乗る）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not settings.openai_api_key:
+                    raise RuntimeError("OPENAI_API_KEY が設定されていません。.env を確認してください。")
+                from openai import AsyncOpenAI
+
+                # 再試行は下の _create で自前で行う（SDK 側の再試行と二重にしない）
+                _client = AsyncOpenAI(api_key=settings.openai_api_key, timeout=OPENAI_TIMEOUT, max_retries=0)
+    return _client
 
 def _compose_prompt(
     name: str,
@@ -43,6 +70,86 @@ def _compose_prompt(
         f"{audience}"
 )
 
+_SYSTEM_PROMPT = (
+    "あなたは旅先を案内する熟練の観光ガイドです。以下を厳守："
+    "1) 300〜400字のスピーチ台本。"
+    "2) 構成は【概要 → 見どころ → 歴史や豆知識 → 楽しみ方 → 注意点】の順で、一続きのナレーションにしてください（見出しは書かない）。"
+    "3) 作り話や推測の断定は禁止。事実ベースで固有名詞と数字を具体的に。"
+    "4) 書き言葉ではなく、話し言葉で自然に。"
+    "5) 誇張やフィクションは禁止。事実ベースで、具体的な地名・年号・施設名などを正確に伝えてください。"
+    "6) 郵便番号・電話番号・座標・緯度経度など、聞いて意味のない数値情報は含めないでください。"
+    "7) 難読地名や人名にはふりがなをつけてください。"
+    "8) 事実に基づき、読者が興味を持つような内容にする。"
+)
+
+
+def _messages(prompt: str) -> list:
+    return [
+        {"role": "system", "content": _SYSTEM_PROMPT},
+        {"role": "user", "content": prompt},
+    ]
+
+
+async def warmup() -> None:
+    """SDK の import とクライアント生成、api.openai.com への TLS 接続を先に済ませる（鍵が無ければ何もしない）"""
+    if not settings.openai_api_key:
+        return
+    client = get_client()
+    await client.with_options(timeout=10).models.retrieve(MODEL_TEXT)  # 課金されない軽い呼び出し
+
+
+# ---- 再試行とトークン使用量 ----
+def _retry_reason(error: Exception) -> Optional[str]:
+    """再試行すべきエラーなら理由（metrics のラベル）を返す"""
+    from openai import APIConnectionError, APIStatusError  # get_client で読み込み済み
+
+    if isinstance(error, APIStatusError):
+        if error.status_code == 429:
+            return "rate_limit"
+        if error.status_code >= 500:
+            return "server_error"
+        return None
+    if isinstance(error, APIConnectionError):  # APITimeoutError も含む
+        return "connection"
+    return None
+
+
+def _backoff(attempt: int, error: Exception) -> float:
+    """full jitter。Retry-After があればそれより短くはしない"""
+    delay = random.uniform(0, min(OPENAI_RETRY_MAX, OPENAI_RETRY_BASE * (2 ** attempt)))
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("retry-after") if response is not None else None
+    try:
+        if retry_after:
+            delay = max(delay, min(OPENAI_RETRY_MAX, float(retry_after)))
+    except ValueError:
+        pass  # HTTP-date 形式は無視
+    return delay
+
+
+async def _create(**kwargs):
+    """chat.completions.create を 429 / 5xx / 接続失敗の時だけ間を空けて再試行する"""
+    for attempt in range(OPENAI_MAX_RETRIES + 1):
+        try:
+            return await get_client().chat.completions.create(**kwargs)
+        except Exception as e:
+            reason = _retry_reason(e)
+            if reason is None or attempt >= OPENAI_MAX_RETRIES:
+                raise
+            delay = _backoff(attempt, e)
+            OPENAI_RETRIES.labels(reason).inc()
+            print(f"GPT retry {attempt + 1}/{OPENAI_MAX_RETRIES} in {delay:.2f}s ({reason}):", repr(e))
+            await asyncio.sleep(delay)
+
+
+def _record_usage(usage) -> None:
+    """1回の生成で使ったトークン数（Histogram の sum/count でガイド1本あたりのコストが出る）"""
+    if usage is None:
+        return
+    OPENAI_TOKENS.labels(MODEL_TEXT, "prompt").observe(usage.prompt_tokens or 0)
+    OPENAI_TOKENS.labels(MODEL_TEXT, "completion").observe(usage.completion_tokens or 0)
+    print(f"GPT usage prompt={usage.prompt_tokens} completion={usage.completion_tokens}")
+
 # ---- visits.py から await で呼ばれるエントリ ----
 async def generate_guide_text(
     name: str,
@@ -58,33 +165,46 @@ async def generate_guide_text(
     print("GPT: generate_guide_text CALLED")
     print("GPT PROMPT >>", prompt[:300].replace("\n", " "))
 
-    def _call_openai():
-        return client.chat.completions.create(
-            model=MODEL_TEXT,
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "あなたは旅先を案内する熟練の観光ガイドです。以下を厳守："
-                        "1) 300〜400字のスピーチ台本。"
-                        "2) 構成は【概要 → 見どころ → 歴史や豆知識 → 楽しみ方 → 注意点】の順で、一続きのナレーションにしてください（見出しは書かない）。"
-                        "3) 作り話や推測の断定は禁止。事実ベースで固有名詞と数字を具体的に。"
-                        "4) 書き言葉ではなく、話し言葉で自然に。"
-                        "5) 誇張やフィクションは禁止。事実ベースで、具体的な地名・年号・施設名などを正確に伝えてください。"
-                        "6) 郵便番号・電話番号・座標・緯度経度など、聞いて意味のない数値情報は含めないでください。"
-                        "7) 難読地名や人名にはふりがなをつけてください。"
-                        "8) 事実に基づき、読者が興味を持つような内容にする。"
-                        ""
-                    ),
-                },
-                {"role": "user", "content": prompt},
-            ],
-            temperature=0.6,
-        )
-
-    # 同期APIをスレッドで実行してイベントループを塞がない
-    resp = await to_thread.run_sync(_call_openai)
+    async with _SEM:
+        with span("openai"):
+            resp = await _create(
+                model=MODEL_TEXT,
+                messages=_messages(prompt),
+                temperature=0.6,
+            )
+    _record_usage(resp.usage)
 
     text = (resp.choices[0].message.content or "").strip()
     print("GPT OK len=", len(text))
     return text
+
+
+# ---- SSE 用: 生成途中のテキストを少しずつ返す ----
+async def stream_guide_text(
+    name: str,
+    address: str,
+    lat: float | None,
+    lng: float | None,
+    style: str = "friendly",
+    user: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    """generate_guide_text と同じプロンプトで stream=True にし、届いた差分テキストを順に yield する"""
+    prompt = _compose_prompt(name=name, address=address, lat=lat, lng=lng, style=style, user=user)
+    # 再試行するのは最初の応答が来るまで（差分を流し始めた後はやり直さない）
+    async with _SEM:
+        with span("openai"):
+            stream = await _create(
+                model=MODEL_TEXT,
+                messages=_messages(prompt),
+                temperature=0.6,
+                stream=True,
+                stream_options={"include_usage": True},  # 最後のチャンクに usage が載る
+            )
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    _record_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    yield delta
@@ -0,0 +1,202 @@
+# app/services/guide_jobs.py
+# ガイド生成（GPT → TTS → guides 保存）をジョブとして裏で回す。
+# POST /visits/jobs は VisitHistory を保存した時点で 202 + job_id を返し、
+# クライアントは GET /visits/jobs/{id}（ポーリング）か /events（SSE）で完了を待つ。
+#
+# ジョブの状態は guide_jobs テーブルに書く（ワーカーが複数でも、どのワーカーに来たポーリングにも答えられる）。
+# 実行はプロセス内キュー（write_behind.WriteBehindQueue）。外部ブローカー（Redis/SQS など）に
+# 載せ替える時は InProcessJobBackend と同じメソッドを持つクラスを足し、GUIDE_JOB_BACKEND で切り替える。
+import asyncio
+import datetime as dt
+import os
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy import delete, update
+
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import guide_reuse, tts
+from app.services.write_behind import WriteBehindQueue
+
+GUIDE_JOB_BACKEND = os.getenv("GUIDE_JOB_BACKEND", "memory").lower()
+GUIDE_JOB_WORKERS = int(os.getenv("GUIDE_JOB_WORKERS", "4"))        # 同時に生成するガイド数
+GUIDE_JOB_QUEUE_SIZE = int(os.getenv("GUIDE_JOB_QUEUE_SIZE", "200"))
+# 停止時に積まれている分を待つ秒数。1件の生成（GPT + TTS）より長くしておく
+# （uvicorn / コンテナの graceful timeout もこれより長くすること）
+GUIDE_JOB_DRAIN_TIMEOUT = float(os.getenv("GUIDE_JOB_DRAIN_TIMEOUT", "90"))
+# 他ワーカーで動いているジョブを /events で待つ時、DB を見直す間隔（秒）
+GUIDE_JOB_POLL_INTERVAL = float(os.getenv("GUIDE_JOB_POLL_INTERVAL", "1"))
+
+FINISHED = ("done", "failed")
+
+
+class QueueFull(Exception):
+    """キューが満杯で受け付けられなかった"""
+
+
+def to_dict(job: models.GuideJob) -> dict:
+    return {
+        "job_id": job.id,
+        "status": job.status,
+        "visit_id": job.visit_id,
+        "guide_id": job.guide_id,
+        "audio_url": job.audio_url,
+        "error": job.error,
+        "created_at": job.created_at,
+        "finished_at": job.finished_at,
+    }
+
+
+class InProcessJobBackend:
+    """プロセス内キュー + ワーカー（lifespan の write_behind.start_all/stop_all で起動・停止）"""
+
+    def __init__(self) -> None:
+        self._queue = WriteBehindQueue(
+            "guide_jobs", workers=GUIDE_JOB_WORKERS, maxsize=GUIDE_JOB_QUEUE_SIZE, drain_timeout=GUIDE_JOB_DRAIN_TIMEOUT
+        )
+        # このプロセスで積んだ未完了ジョブ → 完了通知（/events をすぐ起こす用。状態そのものは DB）
+        self._events: Dict[str, asyncio.Event] = {}
+
+    def has_capacity(self) -> bool:
+        return not self._queue.full()
+
+    def submit(self, job_id: str, fn: Callable[[], Awaitable[None]]) -> None:
+        if not self._queue.submit(job_id, fn):
+            raise QueueFull("guide job queue is full")
+        self._events[job_id] = asyncio.Event()
+
+    def notify(self, job_id: str) -> None:
+        ev = self._events.pop(job_id, None)
+        if ev is not None:
+            ev.set()
+
+    async def wait(self, job_id: str, timeout: float) -> None:
+        """このプロセスのジョブなら完了まで（最大 timeout 秒）、他プロセスのジョブなら次に DB を見るまで待つ"""
+        ev = self._events.get(job_id)
+        if ev is None:
+            await asyncio.sleep(min(GUIDE_JOB_POLL_INTERVAL, timeout))
+            return
+        try:
+            await asyncio.wait_for(ev.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def unfinished(self) -> List[str]:
+        return list(self._events)
+
+
+_BACKENDS: Dict[str, Callable[[], InProcessJobBackend]] = {"memory": InProcessJobBackend}
+if GUIDE_JOB_BACKEND not in _BACKENDS:
+    raise RuntimeError(f"GUIDE_JOB_BACKEND={GUIDE_JOB_BACKEND} は未対応です（対応: {', '.join(_BACKENDS)}）")
+backend = _BACKENDS[GUIDE_JOB_BACKEND]()
+
+
+async def _set(job_id: str, **values) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(models.GuideJob).where(models.GuideJob.id == job_id).values(**values))
+        await db.commit()
+
+
+async def submit_guide_job(dest: models.Destination, visit_id: str, user: Optional[dict] = None) -> models.GuideJob:
+    """guide_jobs に行を作ってジョブを積む（満杯なら行を消して QueueFull）"""
+    async with AsyncSessionLocal() as db:
+        job = models.GuideJob(visit_id=visit_id, destination_id=dest.id, status="queued")
+        db.add(job)
+        await db.commit()
+    job_id = job.id
+    # dest は呼び出し元のセッションが閉じた後に読む（expire_on_commit=False なので読み込み済みの値は使える）
+
+    async def _run() -> None:
+        try:
+            await _set(job_id, status="running")
+            try:
+                text = await guide_reuse.get_or_generate(dest, style="friendly", user=user)
+            except Exception as e:
+                print("GPT guide error (fallback to plain text):", repr(e))
+                text = guide_reuse.fallback_text(dest.name, dest.address)
+
+            try:
+                _, audio_url = await tts.synthesize_to_mp3(text, voice=None)
+            except Exception as e:
+                print("TTS error (fallback to placeholder):", repr(e))
+                audio_url = "/media/guides/README.txt"
+
+            # ガイドの保存とジョブの完了は同じトランザクションで
+            async with AsyncSessionLocal() as db:
+                guide = models.Guide(
+                    destination_id=dest.id,
+                    visit_id=visit_id,
+                    guide_text=text,
+                    voice="",
+                    style="friendly",
+                    audio_url=audio_url or "",
+                    **guide_reuse.segment(user),
+                )
+                db.add(guide)
+                await db.flush()
+                await db.execute(
+                    update(models.GuideJob)
+                    .where(models.GuideJob.id == job_id)
+                    .values(status="done", guide_id=guide.id, audio_url=guide.audio_url, finished_at=dt.datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as e:
+            print("Guide job error:", repr(e))
+            traceback.print_exc()
+            try:
+                await _set(job_id, status="failed", error=type(e).__name__, finished_at=dt.datetime.utcnow())
+            except Exception as e2:
+                print("Guide job status update failed:", repr(e2))
+        # 停止でキャンセルされた時は通知しない（unfinished に残して shutdown() で failed にする）
+        backend.notify(job_id)
+
+    try:
+        backend.submit(job_id, _run)
+    except QueueFull:
+        async with AsyncSessionLocal() as db:
+            await db.execute(delete(models.GuideJob).where(models.GuideJob.id == job_id))
+            await db.commit()
+        raise
+    return job
+
+
+def has_capacity() -> bool:
+    """今 submit_guide_job すれば積めそうか（Visit を保存する前の確認用）"""
+    return backend.has_capacity()
+
+
+async def get_job(job_id: str) -> Optional[dict]:
+    async with AsyncSessionLocal() as db:
+        job = await db.get(models.GuideJob, job_id)
+    return to_dict(job) if job is not None else None
+
+
+async def wait_job(job_id: str, timeout: float) -> Optional[dict]:
+    """終わるか timeout 秒経つまで待って、その時点の状態を返す"""
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while True:
+        job = await get_job(job_id)
+        remaining = deadline - loop.time()
+        if job is None or job["status"] in FINISHED or remaining <= 0:
+            return job
+        await backend.wait(job_id, remaining)
+
+
+async def shutdown() -> None:
+    """lifespan 終了時（write_behind.stop_all の後）に呼ぶ。待ちきれずに捨てたジョブを failed にする"""
+    left = backend.unfinished()
+    if not left:
+        return
+    try:
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                update(models.GuideJob)
+                .where(models.GuideJob.id.in_(left), models.GuideJob.status.not_in(FINISHED))
+                .values(status="failed", error="Interrupted", finished_at=dt.datetime.utcnow())
+            )
+            await db.commit()
+        print(f"[GUIDE-JOBS] {len(left)} jobs interrupted by shutdown")
+    except Exception as e:
+        print("[GUIDE-JOBS] marking interrupted jobs failed:", repr(e))
@@ -0,0 +1,182 @@
+# app/services/guide_reuse.py
+# 同じ目的地・スタイル・利用者セグメント（年代×性別）のガイド本文を使い回す。
+# guides テーブルに新しめの本文が GUIDE_REUSE_VARIANTS 件そろっていれば OpenAI を呼ばずにその中から返す。
+# 本文が同じなら TTS も tts.py のハッシュキャッシュに当たるので、音声合成も省ける。
+import asyncio
+import datetime as dt
+import os
+import random
+import weakref
+from typing import AsyncIterator, List, Optional, Tuple
+
+from sqlalchemy import String, and_, cast, or_, select
+
+from app.core.metrics import CACHE_LOOKUPS
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import gpt
+from app.services.cache import TTLCache
+
+GUIDE_REUSE_ENABLED = os.getenv("GUIDE_REUSE_ENABLED", "true").lower() == "true"
+GUIDE_REUSE_MAX_AGE = float(os.getenv("GUIDE_REUSE_MAX_AGE_HOURS", "168")) * 3600  # 既定 7日
+GUIDE_REUSE_VARIANTS = max(1, int(os.getenv("GUIDE_REUSE_VARIANTS", "1")))       # 何通りそろったら使い回すか
+
+# (destination_id, style, age_group, gender)
+ReuseKey = Tuple[str, str, Optional[str], Optional[str]]
+# (本文, 作成時刻 UTC naive)
+Stored = Tuple[str, dt.datetime]
+
+# 生成直後〜guides 保存までの間に来た同じキーの訪問にも返せるよう、プロセス内にも覚えておく。
+# 値は List[Stored]。TTL はキーごとに「一番古い本文が GUIDE_REUSE_MAX_AGE に達するまで」にする（_cache）
+_RECENT = TTLCache("guide_text", maxsize=int(os.getenv("GUIDE_REUSE_CACHE_SIZE", "2048")), ttl=GUIDE_REUSE_MAX_AGE)
+# キーごとのロック（同じ目的地への最初の訪問が同時に来ても生成は1回）
+_LOCKS: "weakref.WeakValueDictionary[ReuseKey, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def fallback_text(name: str, address: str) -> str:
+    """GPT が失敗した時の定型文（使い回しの対象からは外す）"""
+    return f"{name}（{address}）のご案内です。見どころ、歴史、アクセスをやさしく紹介します。"
+
+
+def reuse_key(dest: models.Destination, style: str, user: Optional[dict]) -> ReuseKey:
+    user = user or {}
+    return (dest.id, style or "friendly", user.get("age_group"), user.get("gender"))
+
+
+def segment(user: Optional[dict]) -> dict:
+    """guides に一緒に保存するセグメント列（models.Guide(**segment(user)) の形で使う）"""
+    user = user or {}
+    return {"age_group": user.get("age_group"), "gender": user.get("gender")}
+
+
+def _lock(key: ReuseKey) -> asyncio.Lock:
+    lock = _LOCKS.get(key)
+    if lock is None:
+        lock = asyncio.Lock()
+        _LOCKS[key] = lock
+    return lock
+
+
+async def _stored_texts(key: ReuseKey, fallback: str) -> List[Stored]:
+    """
+    同じセグメントの新しめの本文を集める。セグメントは guides.age_group / gender で見る
+    （列を足す前の行だけは guides → visit_histories → users を辿る）。
+    生成中（数秒）に接続を握らないよう、照会だけの短いセッションを使う。
+    """
+    dest_id, style, age_group, gender = key
+    cutoff = dt.datetime.utcnow() - dt.timedelta(seconds=GUIDE_REUSE_MAX_AGE)
+    stmt = (
+        select(models.Guide.guide_text, models.Guide.created_at)
+        .outerjoin(models.VisitHistory, models.Guide.visit_id == models.VisitHistory.id)
+        .outerjoin(models.User, models.VisitHistory.user_id == cast(models.User.id, String))
+        .where(
+            models.Guide.destination_id == dest_id,
+            models.Guide.style == style,
+            models.Guide.created_at >= cutoff,
+            models.Guide.guide_text != fallback,
+        )
+        .order_by(models.Guide.created_at.desc())
+        .limit(GUIDE_REUSE_VARIANTS * 4)
+    )
+    G = models.Guide
+    if age_group is None and gender is None:
+        # 未ログイン / プロフィール無し。visit_id の無い行（/guides）は、列を足す前だとプロフィール付きで
+        # 作った本文か区別できないので使わない
+        stmt = stmt.where(
+            G.age_group.is_(None), G.gender.is_(None), G.visit_id.is_not(None), models.User.id.is_(None)
+        )
+    else:
+        stmt = stmt.where(or_(
+            and_(G.age_group == age_group, G.gender == gender),
+            # 列を足す前の行（どちらも NULL）は訪問したユーザーのプロフィールで判断する
+            and_(G.age_group.is_(None), G.gender.is_(None),
+                 models.User.age_group == age_group, models.User.gender == gender),
+        ))
+
+    async with AsyncSessionLocal() as db:
+        rows = (await db.execute(stmt)).all()
+    stored: List[Stored] = []
+    for text, created_at in rows:
+        if text and all(text != t for t, _ in stored):
+            # cutoff と同じく UTC の naive で扱う
+            stored.append((text, (created_at or dt.datetime.utcnow()).replace(tzinfo=None)))
+        if len(stored) >= GUIDE_REUSE_VARIANTS:
+            break
+    return stored
+
+
+def _cache(key: ReuseKey, stored: List[Stored]) -> None:
+    """一番古い本文が GUIDE_REUSE_MAX_AGE に達した時点で切れるように覚える（DB から読んだ時点から数えない）"""
+    oldest = min(created for _, created in stored)
+    ttl = GUIDE_REUSE_MAX_AGE - (dt.datetime.utcnow() - oldest).total_seconds()
+    if ttl > 0:
+        _RECENT.set(key, stored, ttl=ttl)
+    else:
+        _RECENT.invalidate(key)
+
+
+async def _find(key: ReuseKey, fallback: str) -> Optional[str]:
+    stored = _RECENT.get(key)
+    if stored is None:
+        stored = await _stored_texts(key, fallback)
+        if len(stored) >= GUIDE_REUSE_VARIANTS:
+            _cache(key, stored)  # 足りない時は覚えない（他プロセスが保存した分を次回また DB で拾う）
+    if len(stored) >= GUIDE_REUSE_VARIANTS:
+        CACHE_LOOKUPS.labels("guide_text", "hit").inc()
+        return random.choice(stored)[0]
+    CACHE_LOOKUPS.labels("guide_text", "miss").inc()
+    return None
+
+
+def _remember(key: ReuseKey, text: str) -> None:
+    stored = [s for s in (_RECENT.get(key) or []) if s[0] != text]
+    stored.insert(0, (text, dt.datetime.utcnow()))
+    _cache(key, stored[:GUIDE_REUSE_VARIANTS])
+
+
+async def get_or_generate(
+    dest: models.Destination,
+    style: str = "friendly",
+    user: Optional[dict] = None,
+) -> str:
+    """使い回せる本文があれば返し、無ければ gpt.generate_guide_text で作る（失敗時は例外をそのまま送出）"""
+    kwargs = dict(name=dest.name, address=dest.address, lat=dest.lat, lng=dest.lng, style=style, user=user)
+    if not GUIDE_REUSE_ENABLED:
+        return await gpt.generate_guide_text(**kwargs)
+
+    key = reuse_key(dest, style, user)
+    async with _lock(key):
+        text = await _find(key, fallback_text(dest.name, dest.address))
+        if text is not None:
+            return text
+        text = await gpt.generate_guide_text(**kwargs)
+        if text:
+            _remember(key, text)
+        return text
+
+
+async def stream_or_reuse(
+    dest: models.Destination,
+    style: str = "friendly",
+    user: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    """SSE 用: 使い回せる本文があれば1回でまとめて、無ければ gpt.stream_guide_text の差分を順に yield する"""
+    kwargs = dict(name=dest.name, address=dest.address, lat=dest.lat, lng=dest.lng, style=style, user=user)
+    if not GUIDE_REUSE_ENABLED:
+        async for delta in gpt.stream_guide_text(**kwargs):
+            yield delta
+        return
+
+    key = reuse_key(dest, style, user)
+    async with _lock(key):
+        text = await _find(key, fallback_text(dest.name, dest.address))
+        if text is not None:
+            yield text
+            return
+        parts: List[str] = []
+        async for delta in gpt.stream_guide_text(**kwargs):
+            parts.append(delta)
+            yield delta
+        text = "".join(parts).strip()
+        if text:
+            _remember(key, text)
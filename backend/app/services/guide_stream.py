@@ -0,0 +1,95 @@
+# app/services/guide_stream.py
+# ガイド生成（GPT → TTS → guides 保存）を Server-Sent Events で少しずつ返す。
+# /visits/stream と /guides/stream から使う。
+import asyncio
+import json
+import traceback
+from typing import AsyncIterator, List, Optional
+
+from app.db import models
+from app.db.database import AsyncSessionLocal
+from app.services import guide_reuse, tts
+
+# プロキシ（nginx など）にバッファされると途中経過が届かないので無効化しておく
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+async def stream_guide(
+    dest: models.Destination,
+    *,
+    visit_id: Optional[str],
+    style: str = "friendly",
+    voice: Optional[str] = None,
+    user: Optional[dict] = None,
+) -> AsyncIterator[str]:
+    """
+    送るイベント:
+      delta  {"text"}                             本文の差分（OpenAI から届いた順）
+      reset  {}                                   それまでの delta を捨てる（生成が途中で失敗した。続けて定型文の delta が来る）
+      audio  {"url"}                              最初に再生できる音声（冒頭チャンクのみの場合あり）
+      done   {"guide_id", "visit_id", "audio_url", "text"}
+      error  {"detail"}
+    DB セッションは自前で開く（Depends の yield はレスポンス送信前に閉じられるため）。
+    """
+    # 1) 本文: 届いた差分をそのまま流す（使い回せる本文があれば1回で全文）
+    parts: List[str] = []
+    try:
+        async for delta in guide_reuse.stream_or_reuse(dest, style=style, user=user):
+            parts.append(delta)
+            yield sse("delta", {"text": delta})
+    except Exception as e:
+        # 途中で切れた本文は使わない（保存すると使い回しで同じセグメント全員に途切れた案内が流れる）。
+        # create_visit と同じ定型文に差し替える（定型文は使い回しの対象外）
+        print("GPT stream error (fallback to plain text):", repr(e))
+        if parts:
+            parts = []
+            yield sse("reset", {})
+    text = "".join(parts).strip()
+    if not text:
+        text = guide_reuse.fallback_text(dest.name, dest.address)
+        yield sse("delta", {"text": text})
+
+    # 2) 音声: 冒頭チャンクができた時点で audio イベントを送る
+    events: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+    async def _on_first_chunk(path: str, url: str) -> None:
+        await events.put(sse("audio", {"url": url}))
+
+    tts_task = asyncio.create_task(tts.synthesize_to_mp3(text, voice, on_first_chunk=_on_first_chunk))
+    tts_task.add_done_callback(lambda _t: events.put_nowait(None))
+    try:
+        while (item := await events.get()) is not None:
+            yield item
+        _, audio_url = await tts_task
+    except Exception as e:
+        print("TTS error (fallback to placeholder):", repr(e))
+        audio_url = "/media/guides/README.txt"
+    finally:
+        if not tts_task.done():
+            tts_task.cancel()  # クライアント切断時
+
+    # 3) 保存して完了イベント
+    try:
+        async with AsyncSessionLocal() as db:
+            guide = models.Guide(
+                destination_id=dest.id,
+                visit_id=visit_id,
+                guide_text=text,
+                voice=voice or "",
+                style=style,
+                audio_url=audio_url or "",
+                **guide_reuse.segment(user),
+            )
+            db.add(guide)
+            await db.commit()
+    except Exception as e:
+        print("Guide commit error (stream):", repr(e))
+        traceback.print_exc()
+        yield sse("error", {"detail": "Guide save failed"})
+        return
+
+    yield sse("done", {"guide_id": guide.id, "visit_id": visit_id, "audio_url": guide.audio_url, "text": text})
@@ -0,0 +1,110 @@
+# app/services/http_client.py
+# 外部API（Google / YOLP / Gemini / Nominatim）用の共有 httpx.AsyncClient レジストリ。
+# リクエストごとに AsyncClient を作ると毎回 TCP+TLS ハンドシェイクが走るので、
+# FastAPI の lifespan で生成 → 各サービスは get_client() で取り出して使い回す。
+import asyncio
+import os
+from typing import Dict, Optional
+
+import httpx
+
+try:  # HTTP/2 は h2 が入っている時だけ有効化（httpx[http2]）
+    import h2  # noqa: F401
+    _H2_AVAILABLE = True
+except ImportError:
+    _H2_AVAILABLE = False
+
+# ---- 設定（.env で上書き可） ----
+HTTP2_ENABLED = os.getenv("HTTP_CLIENT_HTTP2", "true").lower() == "true" and _H2_AVAILABLE
+MAX_CONNECTIONS = int(os.getenv("HTTP_CLIENT_MAX_CONNECTIONS", "50"))      # ホストごとの上限
+MAX_KEEPALIVE = int(os.getenv("HTTP_CLIENT_MAX_KEEPALIVE", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("HTTP_CLIENT_KEEPALIVE_EXPIRY", "30"))  # 秒
+CONNECT_TIMEOUT = float(os.getenv("HTTP_CLIENT_CONNECT_TIMEOUT", "5"))
+
+# プロバイダ名 → (base_url, read timeout 秒, 追加ヘッダ)
+# timeout の既定値は従来の httpx.AsyncClient(timeout=...) に揃えている
+# base_url は *_BASE_URL で差し替え可（bench/ のローカル偽サーバに向ける時など）
+PROVIDERS: Dict[str, dict] = {
+    "google": {
+        "base_url": os.getenv("GOOGLE_BASE_URL", "https://maps.googleapis.com"),
+        "timeout": float(os.getenv("GOOGLE_HTTP_TIMEOUT", "10")),
+    },
+    "yolp": {
+        "base_url": os.getenv("YOLP_BASE_URL", "https://map.yahooapis.jp"),
+        "timeout": float(os.getenv("YOLP_HTTP_TIMEOUT", "10")),
+    },
+    "gemini": {
+        "base_url": os.getenv("GEMINI_BASE_URL", "https://generativelanguage.googleapis.com"),
+        "timeout": float(os.getenv("GEMINI_HTTP_TIMEOUT", "30")),
+    },
+    "nominatim": {
+        "base_url": os.getenv("NOMINATIM_BASE_URL", "https://nominatim.openstreetmap.org"),
+        "timeout": float(os.getenv("NOMINATIM_HTTP_TIMEOUT", "10")),
+        "headers": {"User-Agent": "SerendiGo/1.0"},
+    },
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    conf = PROVIDERS[name]
+    read = conf["timeout"]
+    return httpx.AsyncClient(
+        base_url=conf["base_url"],
+        headers=conf.get("headers"),
+        http2=HTTP2_ENABLED,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(read, connect=min(CONNECT_TIMEOUT, read)),
+    )
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    プロバイダ名に対応する共有クライアントを返す。
+    lifespan 外（スクリプト実行など）から呼ばれた場合はその場で生成して登録する。
+    """
+    if name not in PROVIDERS:
+        raise KeyError(f"unknown http provider: {name}")
+    client: Optional[httpx.AsyncClient] = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        _clients[name] = client
+    return client
+
+
+async def startup() -> None:
+    """lifespan 開始時に全プロバイダのクライアントを生成"""
+    for name in PROVIDERS:
+        get_client(name)
+    print(f"[HTTP] shared clients ready: {sorted(_clients)} http2={HTTP2_ENABLED}")
+
+
+async def warmup(names: Optional[list] = None) -> Dict[str, str]:
+    """
+    DNS 解決 + TCP/TLS（+ HTTP/2）ハンドシェイクを先に済ませ、keep-alive 接続をプールに残しておく。
+    HEAD / の結果（404 など）は気にしない。戻り値は プロバイダ名 → "ok" / エラー名
+    """
+    async def _one(name: str) -> str:
+        try:
+            await get_client(name).head("/")
+            return "ok"
+        except Exception as e:
+            return type(e).__name__
+
+    names = [n for n in (names or list(PROVIDERS)) if n in PROVIDERS]
+    results = await asyncio.gather(*(_one(n) for n in names))
+    return dict(zip(names, results))
+
+
+async def shutdown() -> None:
+    """lifespan 終了時にコネクションプールを閉じる"""
+    for name, client in list(_clients.items()):
+        try:
+            await client.aclose()
+        finally:
+            _clients.pop(name, None)
@@ -0,0 +1,274 @@
+# app/services/media_store.py
+# /media/guides の置き場所と容量管理。
+# - ファイルはハッシュ先頭4文字で2段に分ける（guides/ab/cd/<hash>.mp3）。1ディレクトリあたりの件数が
+#   数百万件でも数十件程度に収まり、一覧・探索のコストが増えない
+# - サイズと最終アクセスは media_objects テーブルに記録する。書き込み/アクセスはメモリに溜めて
+#   バックグラウンドでまとめて反映する（リクエスト中に DB を触らない）。テーブルはデプロイ時に
+#   python -m app.db.database で作る（無ければ一度だけログを出し、作られるまで記録と削除を止める）
+# - 合計が MEDIA_QUOTA_MB を超えたら、最後のアクセスが古いものから消す。
+#   ただし guides.audio_url から参照されているファイル（とその .ogg）は消さない
+import asyncio
+import datetime as dt
+import os
+import pathlib
+import time
+from typing import Dict, Optional, Tuple, Union
+
+from anyio import to_thread
+from sqlalchemy import bindparam, delete, func, select, tuple_, update
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from app.core.config import settings
+from app.db import models
+from app.db.database import AsyncSessionLocal
+
+MEDIA_ROOT = settings.media_root.resolve()
+GUIDE_DIR = MEDIA_ROOT / "guides"  # 作成は startup（import 時にファイルシステムを触らない）
+
+MEDIA_QUOTA_BYTES = int(float(os.getenv("MEDIA_QUOTA_MB", "5120")) * 1024 * 1024)  # 0 なら消さない
+MEDIA_EVICT_LOW_WATER = float(os.getenv("MEDIA_EVICT_LOW_WATER", "0.9"))  # 上限の何割まで減らすか
+MEDIA_FLUSH_INTERVAL = float(os.getenv("MEDIA_FLUSH_INTERVAL", "30"))     # 記録の反映間隔（秒）
+MEDIA_EVICT_INTERVAL = float(os.getenv("MEDIA_EVICT_INTERVAL", "600"))    # 容量チェックの間隔（秒）
+# 最後のアクセスからこの秒数は消さない。生成直後（guides 保存前）や、他ワーカーがまだ反映していない
+# アクセスのあるファイルを守るため、反映間隔より十分長くしておく
+MEDIA_EVICT_MIN_AGE = float(os.getenv("MEDIA_EVICT_MIN_AGE", "3600"))
+_EVICT_BATCH = 200
+# media_objects テーブルが無い時（スキーマ作成前）に、作られたか見直す間隔（秒）
+MEDIA_TABLE_RECHECK_INTERVAL = float(os.getenv("MEDIA_TABLE_RECHECK_INTERVAL", "600"))
+
+PathLike = Union[str, pathlib.Path]
+
+# まだ DB に反映していない記録（相対パス → サイズ / 最終アクセス時刻）
+_pending_writes: Dict[str, Tuple[int, float]] = {}
+_pending_touches: Dict[str, float] = {}
+_task: Optional[asyncio.Task] = None
+# media_objects が無いと分かった時刻（monotonic）。None なら有る（か、まだ確かめていない）
+_table_missing_since: Optional[float] = None
+
+
+def _shard(name: str) -> str:
+    return f"{name[:2]}/{name[2:4]}/{name}"
+
+
+def guide_path(name: str) -> Tuple[pathlib.Path, str]:
+    """ハッシュ / uuid hex で始まるファイル名 → (保存先パス, 公開URL)"""
+    rel = f"guides/{_shard(name)}"
+    return MEDIA_ROOT / rel, f"/media/{rel}"
+
+
+def _rel(path: PathLike) -> Optional[str]:
+    try:
+        return pathlib.Path(path).resolve().relative_to(MEDIA_ROOT).as_posix()
+    except ValueError:
+        return None  # MEDIA_ROOT の外は管理しない
+
+
+def record(path: PathLike, size: Optional[int] = None) -> None:
+    """ファイルを書いた（次の反映で media_objects に入る）"""
+    rel = _rel(path)
+    if rel is None:
+        return
+    if size is None:
+        size = pathlib.Path(path).stat().st_size
+    _pending_writes[rel] = (size, time.time())
+
+
+def touch(path: PathLike) -> None:
+    """ファイルが使われた（配信 / TTS キャッシュヒット）"""
+    rel = _rel(path)
+    if rel is not None:
+        _pending_touches[rel] = time.time()
+
+
+def _utc(ts: float) -> dt.datetime:
+    return dt.datetime.utcfromtimestamp(ts)
+
+
+async def flush() -> None:
+    """溜まった書き込み/アクセスを media_objects に反映する"""
+    global _pending_writes, _pending_touches
+    writes, _pending_writes = _pending_writes, {}
+    touches, _pending_touches = _pending_touches, {}
+    if not writes and not touches:
+        return
+
+    async with AsyncSessionLocal() as db:
+        for rel, (size, ts) in writes.items():
+            await db.merge(models.MediaObject(path=rel, size=size, last_access_at=_utc(ts)))
+        try:
+            await db.commit()
+        except IntegrityError:
+            # 他ワーカーが同じファイルを先に登録した（merge を1件ずつやり直す）
+            await db.rollback()
+            for rel, (size, ts) in writes.items():
+                await db.merge(models.MediaObject(path=rel, size=size, last_access_at=_utc(ts)))
+                try:
+                    await db.commit()
+                except IntegrityError:
+                    await db.rollback()
+
+        if touches:
+            table = models.MediaObject.__table__
+            await db.execute(
+                update(table)
+                .where(table.c.path == bindparam("b_path"))
+                .values(last_access_at=bindparam("b_ts")),
+                [{"b_path": rel, "b_ts": _utc(ts)} for rel, ts in touches.items()],
+            )
+            await db.commit()
+
+
+def _owner_url(rel: str) -> str:
+    """guides.audio_url に入る URL。別エンコード（tts の .ogg）は同じ名前の .mp3 が参照されていれば残す"""
+    if rel.endswith(".ogg"):
+        rel = rel[: -len(".ogg")] + ".mp3"
+    return f"/media/{rel}"
+
+
+def _unlink(rel: str) -> None:
+    (MEDIA_ROOT / rel).unlink(missing_ok=True)
+
+
+async def evict() -> int:
+    """容量を超えていれば、参照されていない古いファイルから消す。消したバイト数を返す"""
+    if MEDIA_QUOTA_BYTES <= 0:
+        return 0
+    MO = models.MediaObject
+    async with AsyncSessionLocal() as db:
+        total = (await db.execute(select(func.coalesce(func.sum(MO.size), 0)))).scalar_one()
+        if total <= MEDIA_QUOTA_BYTES:
+            return 0
+
+        goal = int(MEDIA_QUOTA_BYTES * MEDIA_EVICT_LOW_WATER)
+        cutoff = _utc(time.time() - MEDIA_EVICT_MIN_AGE)
+        freed, after = 0, None
+        while total - freed > goal:
+            stmt = (
+                select(MO.path, MO.size, MO.last_access_at)
+                .where(MO.last_access_at < cutoff)
+                .order_by(MO.last_access_at, MO.path)
+                .limit(_EVICT_BATCH)
+            )
+            if after is not None:
+                stmt = stmt.where(tuple_(MO.last_access_at, MO.path) > tuple_(*after))
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                break
+            after = (rows[-1].last_access_at, rows[-1].path)
+
+            urls = list({_owner_url(r.path) for r in rows})
+            referenced = set(
+                (await db.execute(select(models.Guide.audio_url).where(models.Guide.audio_url.in_(urls)))).scalars()
+            )
+            victims = []
+            for r in rows:
+                if _owner_url(r.path) in referenced:
+                    continue
+                victims.append(r.path)
+                freed += r.size
+                if total - freed <= goal:
+                    break
+            if not victims:
+                continue
+
+            for rel in victims:
+                await to_thread.run_sync(_unlink, rel)
+            await db.execute(delete(MO).where(MO.path.in_(victims)))
+            await db.commit()
+
+    if freed:
+        print(f"[MEDIA] evicted {freed / 1024 / 1024:.1f} MB (total was {total / 1024 / 1024:.1f} MB)")
+    return freed
+
+
+def _is_missing_table(e: Exception) -> bool:
+    """MySQL 1146 "Table '...media_objects' doesn't exist" / SQLite "no such table: media_objects" """
+    msg = str(getattr(e, "orig", e)).lower()
+    return "media_objects" in msg and ("doesn't exist" in msg or "no such table" in msg)
+
+
+def _table_missing() -> bool:
+    return _table_missing_since is not None and time.monotonic() - _table_missing_since < MEDIA_TABLE_RECHECK_INTERVAL
+
+
+async def _loop() -> None:
+    global _table_missing_since
+    last_evict = 0.0
+    while True:
+        await asyncio.sleep(MEDIA_FLUSH_INTERVAL)
+        if _table_missing():
+            # 反映先が無いので溜めない（テーブルができたら reindex で取り込める）
+            _pending_writes.clear()
+            _pending_touches.clear()
+            continue
+        try:
+            await flush()
+            if time.monotonic() - last_evict >= MEDIA_EVICT_INTERVAL:
+                last_evict = time.monotonic()
+                await evict()
+        except asyncio.CancelledError:
+            raise
+        except (OperationalError, ProgrammingError) as e:
+            if not _is_missing_table(e):
+                print("[MEDIA] flush/evict failed:", repr(e))
+                continue
+            if _table_missing_since is None:  # 一度だけ出す（以降は見直しの間隔ごとに黙って確かめる）
+                print("[MEDIA] media_objects table is missing; run `python -m app.db.database` to create it. "
+                      "Access tracking and eviction are paused until then.")
+            _table_missing_since = time.monotonic()
+        except Exception as e:
+            print("[MEDIA] flush/evict failed:", repr(e))
+        else:
+            if _table_missing_since is not None:
+                _table_missing_since = None
+                print("[MEDIA] media_objects table found; access tracking resumed "
+                      "(run `python -m app.services.media_store reindex` to register existing files)")
+
+
+async def startup() -> None:
+    global _task
+    GUIDE_DIR.mkdir(parents=True, exist_ok=True)
+    if _task is None:
+        _task = asyncio.create_task(_loop())
+
+
+async def shutdown() -> None:
+    global _task
+    if _task is not None:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
+    if _table_missing():
+        return
+    try:
+        await flush()  # 溜まっている分を書いてから終わる
+    except Exception as e:
+        print("[MEDIA] final flush failed:", repr(e))
+
+
+async def reindex() -> int:
+    """既存のファイル（分割前のフラットな guides/*.mp3 を含む）を media_objects に登録し直す"""
+    count = 0
+    for dirpath, _dirs, files in os.walk(GUIDE_DIR):
+        for name in files:
+            if name.startswith("."):
+                continue  # 書きかけの .tmp
+            path = pathlib.Path(dirpath) / name
+            st = path.stat()
+            rel = _rel(path)
+            if rel is not None:
+                _pending_writes[rel] = (st.st_size, st.st_mtime)
+                count += 1
+        if len(_pending_writes) >= 1000:
+            await flush()
+    await flush()
+    return count
+
+
+if __name__ == "__main__":
+    # python -m app.services.media_store reindex
+    import sys
+
+    if sys.argv[1:] != ["reindex"]:
+        sys.exit("usage: python -m app.services.media_store reindex")
+    print(f"[MEDIA] indexed {asyncio.run(reindex())} files under {GUIDE_DIR}")
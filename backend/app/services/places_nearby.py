@@ -1,16 +1,35 @@
 # 寄り道ガイド専用の Nearby 検索モジュール（既存 places.py は触らない）
-from dotenv import load_dotenv
-load_dotenv()
-
 import os
-import httpx
+import math
+import asyncio
 from typing import List, Optional
 from .geo import haversine_km
+from .http_client import get_client
+from app.core.config import settings
+from app.core.timing import span
+from .cache import TTLCache
+from .singleflight import SingleFlight
 
 # 既存の env 名に合わせる（GOOGLE_MAPS_API_KEY を使う）
-GOOGLE_API = os.getenv("GOOGLE_MAPS_API_KEY") or ""
+GOOGLE_API = settings.google_maps_api_key
 REGION = os.getenv("GOOGLE_PLACES_REGION", "jp")
 LANG = os.getenv("GOOGLE_PLACES_LANGUAGE", "ja")
+NEARBY_PATH = "/maps/api/place/nearbysearch/json"
+# タイプ別 fan-out の同時実行数と1リクエストあたりのタイムアウト（秒）
+NEARBY_CONCURRENCY = int(os.getenv("GOOGLE_NEARBY_CONCURRENCY", "6"))
+NEARBY_TIMEOUT = float(os.getenv("GOOGLE_NEARBY_TIMEOUT", "8"))
+
+# ジオタイルキャッシュ（同じ駅周辺の検索結果を使い回す）
+NEARBY_CACHE_ENABLED = os.getenv("NEARBY_CACHE_ENABLED", "true").lower() == "true"
+NEARBY_TILE_DEG = float(os.getenv("NEARBY_TILE_DEG", "0.005"))          # 約500m四方
+NEARBY_RADIUS_STEP_M = int(os.getenv("NEARBY_RADIUS_STEP_M", "250"))    # 半径の丸め単位
+_NEARBY_CACHE = TTLCache(
+    "google_nearby",
+    maxsize=int(os.getenv("NEARBY_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("NEARBY_CACHE_TTL", "600")),            # fresh: 10分
+    stale_ttl=float(os.getenv("NEARBY_CACHE_STALE_TTL", "1800")),  # その後30分は stale を返しつつ裏で更新
+)
+_NEARBY_FLIGHT = SingleFlight("google_nearby")
 
 def _photo_url(ref: str, maxw: int = 800) -> str:
     return (f"https://maps.googleapis.com/maps/api/place/photo"
@@ -30,6 +49,42 @@ TYPE_MAP = {
     }
 }
 
+class NearbyUnavailable(Exception):
+    """全タイプのリクエストが失敗した（キャッシュに空結果を載せないための印）"""
+
+
+def _tile_key(lat: float, lng: float, radius_m: int, detour_type: str, categories: Optional[List[str]]):
+    """
+    位置をタイル（NEARBY_TILE_DEG 四方）に量子化し、半径もバケットに丸めてキーを作る。
+    同じ駅周辺の利用者は同じタイル中心・同じ半径で問い合わせることになる。
+    """
+    ti = math.floor(lat / NEARBY_TILE_DEG)
+    tj = math.floor(lng / NEARBY_TILE_DEG)
+    step = max(1, NEARBY_RADIUS_STEP_M)
+    radius_bucket = int(math.ceil(radius_m / step) * step)
+    keyword = " ".join(categories) if categories else None
+    return (ti, tj, radius_bucket, detour_type, keyword)
+
+
+def _tile_half_diagonal_m(ti: int) -> int:
+    """タイル中心から角までの距離（m）。利用者はタイル内のどこにいてもこの範囲に収まる"""
+    center_lat = (ti + 0.5) * NEARBY_TILE_DEG
+    half_lat_m = NEARBY_TILE_DEG * 111_320 / 2
+    half_lng_m = NEARBY_TILE_DEG * 111_320 * math.cos(math.radians(center_lat)) / 2
+    return int(math.ceil(math.hypot(half_lat_m, half_lng_m)))
+
+
+def _check_status(data: dict) -> List[dict]:
+    """
+    HTTP 200 でも OVER_QUERY_LIMIT / REQUEST_DENIED / INVALID_REQUEST などは results が空で返る。
+    空結果としてキャッシュしないよう、OK / ZERO_RESULTS 以外は例外にする
+    """
+    status = data.get("status")
+    if status in ("OK", "ZERO_RESULTS"):
+        return data.get("results", [])
+    raise RuntimeError(f"Places Nearby error: {data.get('error_message', status)}")
+
+
 async def google_nearby(
     lat: float,
     lng: float,
@@ -41,6 +96,60 @@ async def google_nearby(
     if not GOOGLE_API:
         return []
 
+    if NEARBY_CACHE_ENABLED:
+        key = _tile_key(lat, lng, radius_m, detour_type, categories)
+        ti, tj, radius_bucket, _, _ = key
+        center_lat = (ti + 0.5) * NEARBY_TILE_DEG
+        center_lng = (tj + 0.5) * NEARBY_TILE_DEG
+        # タイル中心から問い合わせるので、半径に中心〜角の距離を足して利用者の円を必ず覆う
+        # （範囲外の分は下で利用者の実座標と radius_m で落とす）。Nearby Search の上限は 50km
+        query_radius = min(50_000, radius_bucket + _tile_half_diagonal_m(ti))
+        # キャッシュミス・裏での再取得とも single-flight 経由（同じタイルの同時ミスは1本にまとめる）
+        def loader():
+            return _NEARBY_FLIGHT.do(
+                key, lambda: _fetch_places(center_lat, center_lng, query_radius, detour_type, categories)
+            )
+        try:
+            shared = await _NEARBY_CACHE.get_or_load(key, loader)
+        except NearbyUnavailable:
+            return []
+        max_km: Optional[float] = radius_m / 1000.0
+    else:
+        max_km = None  # 利用者の実座標・実半径で問い合わせているので Google の結果をそのまま使う
+        key = (lat, lng, radius_m, detour_type, " ".join(categories) if categories else None)
+        try:
+            shared = await _NEARBY_FLIGHT.do(
+                key, lambda: _fetch_places(lat, lng, radius_m, detour_type, categories)
+            )
+        except NearbyUnavailable:
+            return []
+    # キャッシュ/相乗り先と共有している dict を汚さないようコピーしてから距離を付ける
+    results = [dict(x) for x in shared]
+
+    # 重複除去＋距離付与＋ソート（距離は利用者の実座標から測る）
+    uniq, seen = [], set()
+    for x in results:
+        key = (x["name"], round(x["lat"], 5), round(x["lng"], 5))
+        if key in seen:
+            continue
+        seen.add(key)
+        x["distance_km"] = haversine_km(lat, lng, x["lat"], x["lng"])
+        if max_km is not None and x["distance_km"] > max_km:
+            continue  # タイル単位で広めに取った分のうち、利用者の半径の外
+        uniq.append(x)
+
+    uniq.sort(key=lambda x: (x["distance_km"], -(x.get("rating") or 0)))
+    return uniq
+
+
+async def _fetch_places(
+    lat: float,
+    lng: float,
+    radius_m: int,
+    detour_type: str,
+    categories: Optional[List[str]] = None,
+) -> List[dict]:
+    """Nearby Search を叩いて整形済みの候補（距離なし・重複あり）を返す。"""
     base_params = {
         "location": f"{lat},{lng}",
         "radius": radius_m,
@@ -52,22 +161,42 @@ async def google_nearby(
     conf = TYPE_MAP.get(detour_type, {})
     results: List[dict] = []
 
-    async with httpx.AsyncClient(timeout=10) as client:
-        if categories:  # キーワード優先
+    client = get_client("google")  # 共有クライアント（lifespanで生成）
+    if categories:  # キーワード優先
+        params = dict(base_params)
+        params["keyword"] = " ".join(categories)
+        try:
+            with span("google_places"):
+                resp = await client.get(NEARBY_PATH, params=params)
+                batch = _check_status(resp.json())
+        except RuntimeError as e:
+            # クォータ超過などはキャッシュに載せない（従来どおり呼び出し側には空で返す）
+            raise NearbyUnavailable(str(e)) from e
+        batches = [batch]
+    else:
+        # タイプごとのリクエストを並列に投げる（同時実行数は Semaphore で制限）
+        sem = asyncio.Semaphore(max(1, NEARBY_CONCURRENCY))
+
+        async def _fetch(t: Optional[str]) -> List[dict]:
             params = dict(base_params)
-            params["keyword"] = " ".join(categories)
-            resp = await client.get("https://maps.googleapis.com/maps/api/place/nearbysearch/json", params=params)
-            data = resp.json()
-            batches = [data.get("results", [])]
-        else:
-            batches = []
-            for t in conf.get("types", [None]):
-                params = dict(base_params)
-                if t:
-                    params["type"] = t
-                resp = await client.get("https://maps.googleapis.com/maps/api/place/nearbysearch/json", params=params)
-                data = resp.json()
-                batches.append(data.get("results", []))
+            if t:
+                params["type"] = t
+            async with sem:
+                with span("google_places"):
+                    resp = await asyncio.wait_for(client.get(NEARBY_PATH, params=params), NEARBY_TIMEOUT)
+                    return _check_status(resp.json())
+
+        types = conf.get("types", [None])
+        outcomes = await asyncio.gather(*(_fetch(t) for t in types), return_exceptions=True)
+        batches = []
+        for t, out in zip(types, outcomes):
+            if isinstance(out, BaseException):
+                # 一部タイプの失敗は握りつぶして、取れた分だけで続行
+                print(f"[NEARBY] type={t} failed: {out!r}")
+                continue
+            batches.append(out)
+        if not batches:
+            raise NearbyUnavailable(f"all {len(types)} nearby requests failed")
 
     for batch in batches:
         for r in batch:
@@ -90,15 +219,4 @@ async def google_nearby(
                 "source": "google",
             })
 
-    # 重複除去＋距離付与＋ソート
-    uniq, seen = [], set()
-    for x in results:
-        key = (x["name"], round(x["lat"], 5), round(x["lng"], 5))
-        if key in seen:
-            continue
-        seen.add(key)
-        x["distance_km"] = haversine_km(lat, lng, x["lat"], x["lng"])
-        uniq.append(x)
-
-    uniq.sort(key=lambda x: (x["distance_km"], -(x.get("rating") or 0)))
-    return uniq
+    return results
@@ -0,0 +1,50 @@
+# app/services/singleflight.py
+# 同じキーの外部API呼び出しが同時に走ったら、1本だけ上流に投げて結果を共有する（single-flight）。
+# 駅前などで同時に検索が集中した時にクォータを守り、待っている全員のテール遅延を下げる。
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+from app.core.metrics import SINGLEFLIGHT_CALLS
+
+# name → SingleFlight（/__cache_stats で一覧表示する）
+_REGISTRY: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0    # 実際に上流へ投げた回数
+        self.shared = 0   # 既存の in-flight に相乗りした回数
+        _REGISTRY[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        key が実行中ならその結果を待ち、無ければ fn() を開始する。
+        呼び出し元がキャンセルされても共有タスク自体は止めない（shield）。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            SINGLEFLIGHT_CALLS.labels(self.name, "leader").inc()
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._done(k, t))
+        else:
+            self.shared += 1
+            SINGLEFLIGHT_CALLS.labels(self.name, "shared").inc()
+        return await asyncio.shield(task)
+
+    def _done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待ち手が全員キャンセルされた場合の "exception was never retrieved" を防ぐ
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
+
+
+def singleflight_stats() -> Dict[str, dict]:
+    return {name: sf.stats() for name, sf in _REGISTRY.items()}
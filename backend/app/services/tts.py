@@ -1,29 +1,29 @@
-from dotenv import load_dotenv
-load_dotenv()
-
+# app/services/tts.py
+# google-cloud-texttospeech は import が重い（gRPC / protobuf）ので、クライアントを作る時に読み込む
 import os
 import uuid
 import pathlib
 import re
-from typing import Tuple
+import json
+import hashlib
+import threading
+import asyncio
+import inspect
+from typing import TYPE_CHECKING, Any, Callable, List, Optional, Tuple
 
 from anyio import to_thread  # ← 追加（非同期で同期APIを呼ぶ）
-from google.cloud import texttospeech  # ← 追加
-
-# GOOGLE_APPLICATION_CREDENTIALS を環境変数に設定（パス補正付き）
-cred_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-
-# 🔽 ここを追加！
-print("★ cred_path (raw) >>", cred_path)
-
-if cred_path and not os.path.isabs(cred_path):
-    cred_path = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", cred_path))
+from app.core.config import settings
+from app.core.timing import span
+from app.core.metrics import CACHE_LOOKUPS
+from app.services import media_store
+from app.services.singleflight import SingleFlight
+from app.services.write_behind import WriteBehindQueue
 
-# 🔽 絶対パスに変換後の確認も追加！
-print("★ cred_path (absolute) >>", cred_path)
-print("★ os.path.exists(cred_path) >>", os.path.exists(cred_path))
+if TYPE_CHECKING:
+    from google.cloud import texttospeech
 
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = cred_path
+# 接続先の差し替え（bench/ のローカル偽サーバなど）。指定時は REST + 匿名認証で呼ぶ
+TTS_ENDPOINT = settings.google_tts_endpoint
 
 def clean_guide_text_for_tts(text: str) -> str:
     """
@@ -46,9 +46,144 @@ def clean_guide_text_for_tts(text: str) -> str:
 
 
 
-MEDIA_DIR = os.getenv("MEDIA_ROOT", "./media")
-GUIDE_DIR = pathlib.Path(MEDIA_DIR) / "guides"
-GUIDE_DIR.mkdir(parents=True, exist_ok=True)
+# 保存先は media_store（ハッシュ先頭で分けたディレクトリ + 容量上限）
+GUIDE_DIR = media_store.GUIDE_DIR
+
+# 同じ原稿・声・音声設定なら同じファイル名（ハッシュ）にして、2回目以降は API を呼ばずに使い回す
+TTS_CACHE_ENABLED = os.getenv("TTS_CACHE_ENABLED", "true").lower() == "true"
+_TTS_FLIGHT = SingleFlight("google_tts")  # 同じ音声の同時生成は1本にまとめる
+
+# 音声設定（変えたらキャッシュキーも変わる）
+LANGUAGE_CODE = "ja-JP"
+SPEAKING_RATE = 1.0     # 0.25〜4.0
+PITCH = 0.0             # -20.0〜20.0 semitones
+VOLUME_GAIN_DB = 0.0    # -96.0〜16.0 dB
+
+
+# プロセス共通の TextToSpeechClient（認証情報の読み込み・gRPC チャネル・TLS を使い回す）
+TTS_WARMUP = os.getenv("TTS_WARMUP", "true").lower() == "true"
+_client: "texttospeech.TextToSpeechClient | None" = None
+_client_lock = threading.Lock()
+
+
+def _build_client() -> "texttospeech.TextToSpeechClient":
+    from google.cloud import texttospeech
+
+    if TTS_ENDPOINT:
+        from google.auth.credentials import AnonymousCredentials
+
+        return texttospeech.TextToSpeechClient(
+            credentials=AnonymousCredentials(),
+            transport="rest",
+            client_options={"api_endpoint": TTS_ENDPOINT},
+        )
+    if settings.google_application_credentials:
+        # 環境変数を書き換えず、settings で絶対パスにした鍵ファイルを直接渡す
+        import google.auth
+
+        credentials, _ = google.auth.load_credentials_from_file(
+            str(settings.google_application_credentials),
+            scopes=["https://www.googleapis.com/auth/cloud-platform"],
+        )
+        return texttospeech.TextToSpeechClient(credentials=credentials)
+    return texttospeech.TextToSpeechClient()
+
+
+def get_client() -> "texttospeech.TextToSpeechClient":
+    """初回呼び出し時に生成（スレッドから同時に呼ばれても1つだけ作る）"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = _build_client()
+    return _client
+
+
+async def warmup() -> None:
+    """
+    クライアントを作り、軽いAPI呼び出しでチャネルを張っておく（app/core/warmup.py から裏で呼ばれる）。
+    SDK の import と認証で数百ms〜かかる。TTS_WARMUP=false なら最初の合成時に作る。失敗時は例外を送出
+    """
+    if not TTS_WARMUP:
+        return
+    client = await to_thread.run_sync(get_client)
+    await to_thread.run_sync(lambda: client.list_voices(language_code=LANGUAGE_CODE))
+
+
+async def shutdown() -> None:
+    """lifespan 終了時にチャネルを閉じる"""
+    global _client
+    with _client_lock:
+        client, _client = _client, None
+    if client is not None:
+        try:
+            client.transport.close()
+        except Exception:
+            pass
+
+
+# 句点（。）で区切ってチャンクごとに並列合成する。1つ目は短めにして最初の音声を早く出す
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", "200"))
+TTS_FIRST_CHUNK_CHARS = int(os.getenv("TTS_FIRST_CHUNK_CHARS", "80"))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", "4"))
+
+
+def _split_chunks(text: str) -> List[str]:
+    """文単位で詰めてチャンクにする（1文が上限を超える場合はその文だけで1チャンク）"""
+    sentences = [x.strip() for x in re.split(r"(?<=。)", text) if x.strip()]
+    chunks: List[str] = []
+    buf = ""
+    for sent in sentences:
+        limit = TTS_CHUNK_CHARS if chunks else TTS_FIRST_CHUNK_CHARS
+        if buf and len(buf) + 1 + len(sent) > limit:
+            chunks.append(buf)
+            buf = sent
+        else:
+            buf = f"{buf} {sent}" if buf else sent
+    if buf:
+        chunks.append(buf)
+    return chunks or [text]
+
+
+async def _notify(callback: Callable[[str, str], Any], path: str, url: str) -> None:
+    """on_first_chunk を呼ぶ（同期/非同期どちらでも可。失敗しても合成は続ける）"""
+    try:
+        result = callback(path, url)
+        if inspect.isawaitable(result):
+            await result
+    except Exception as e:
+        print("TTS on_first_chunk error:", repr(e))
+
+
+def _audio_key(cleaned_text: str, voice_name: str) -> str:
+    """整形後テキスト + 声 + 音声設定のハッシュ（ファイル名に使う）"""
+    payload = json.dumps(
+        {
+            "text": cleaned_text,
+            "voice": voice_name,
+            "lang": LANGUAGE_CODE,
+            "encoding": "MP3",
+            "rate": SPEAKING_RATE,
+            "pitch": PITCH,
+            "gain": VOLUME_GAIN_DB,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _write_atomic(path: pathlib.Path, data: bytes) -> None:
+    """一時ファイルに書いてから rename（同時アクセスで書きかけのファイルを配信しない）"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+    media_store.record(path, len(data))
 
 
 def _select_google_voice(voice: str | None) -> str:
@@ -84,60 +219,143 @@ def _build_ssml_from_text(text: str) -> str:
     return ssml
 
 
-async def synthesize_to_mp3(text: str, voice: str | None = None) -> Tuple[str, str]:
+def _call_gcp_tts(
+    chunk_text: str,
+    voice_name: str,
+    encoding: str = "MP3",
+    sample_rate_hertz: int = 0,
+) -> bytes:
+    client = get_client()
+    from google.cloud import texttospeech  # get_client で読み込み済み
+
+    # SSMLで渡す（自然さ向上・調整しやすい）
+    input_ = texttospeech.SynthesisInput(ssml=_build_ssml_from_text(chunk_text))
+
+    # 音色選択
+    voice_params = texttospeech.VoiceSelectionParams(
+        language_code=LANGUAGE_CODE,
+        name=voice_name,  # 例: "ja-JP-Neural2-C"
+    )
+
+    # 既定は MP3 で出力（0 = その声の標準サンプルレート）
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding[encoding],
+        speaking_rate=SPEAKING_RATE,
+        pitch=PITCH,
+        volume_gain_db=VOLUME_GAIN_DB,
+        sample_rate_hertz=sample_rate_hertz,
+    )
+
+    response = client.synthesize_speech(
+        input=input_,
+        voice=voice_params,
+        audio_config=audio_config,
+    )
+    return response.audio_content
+
+
+# モバイル向けの軽い版（OGG_OPUS）を MP3 と同じ名前の .ogg として隣に置く（/media で Accept / ?format= で選ぶ）
+# Ogg はチャンクを単純に連結できないので、全文を1回で合成する。応答を待たせないよう裏のキューで作る
+TTS_OPUS_ENABLED = os.getenv("TTS_OPUS_ENABLED", "true").lower() == "true"
+TTS_OPUS_SAMPLE_RATE = int(os.getenv("TTS_OPUS_SAMPLE_RATE", "16000"))  # 話し声なら 16kHz で十分
+_variant_queue = WriteBehindQueue(
+    "tts_variants",
+    workers=int(os.getenv("TTS_VARIANT_WORKERS", "2")),
+    maxsize=int(os.getenv("TTS_VARIANT_QUEUE_SIZE", "500")),
+)
+
+
+def _schedule_variants(cleaned_text: str, voice_name: str, stem: str) -> None:
+    """.ogg がまだ無ければ作るジョブを積む（満杯なら捨てる＝次に同じ音声が使われた時にまた積む）"""
+    if not TTS_OPUS_ENABLED:
+        return
+    ogg_path, _ = media_store.guide_path(f"{stem}.ogg")
+    if ogg_path.is_file():
+        return
+
+    async def _make_ogg() -> None:
+        with span("google_tts"):
+            audio = await to_thread.run_sync(
+                _call_gcp_tts, cleaned_text, voice_name, "OGG_OPUS", TTS_OPUS_SAMPLE_RATE
+            )
+        await to_thread.run_sync(_write_atomic, ogg_path, audio)
+
+    _variant_queue.submit(stem, _make_ogg)
+
+
+async def synthesize_to_mp3(
+    text: str,
+    voice: str | None = None,
+    on_first_chunk: Optional[Callable[[str, str], Any]] = None,
+) -> Tuple[str, str]:
     """
     テキストをMP3に変換して保存（Google Cloud Text-to-Speech版）。
     戻り値: (local_file_path, public_url)
+    - 句点で分けたチャンクを並列に合成し、順番どおりに連結して1つのMP3にする
+    - on_first_chunk(path, url) は最初に再生できる音声ができた時点で1回呼ばれる
+      （1つ目のチャンク単体のMP3。キャッシュヒット/1チャンクのみの時は完成版）
+    - 同じ原稿・声・設定の音声が既にあれば API を呼ばずにそのURLを返す
+    - 同じ名前の .ogg（OGG_OPUS）を裏で作る（TTS_OPUS_ENABLED）
     - 失敗時は .txt を保存して必ずURLを返す（既存互換）
     """
-    filename = f"{uuid.uuid4()}.mp3"
-    out_path = GUIDE_DIR / filename
-    url = f"/media/guides/{filename}"
-
     cleaned_text = clean_guide_text_for_tts(text)
+    voice_name = _select_google_voice(voice)
 
-    def _call_gcp_tts():
-        client = texttospeech.TextToSpeechClient()
+    digest = _audio_key(cleaned_text, voice_name)
+    stem = digest if TTS_CACHE_ENABLED else uuid.uuid4().hex
+    out_path, url = media_store.guide_path(f"{stem}.mp3")
+    first_path, first_url = media_store.guide_path(f"{stem}.first.mp3")
+    notified = False
 
-        # SSMLで渡す（自然さ向上・調整しやすい）
-        input_ = texttospeech.SynthesisInput(ssml=_build_ssml_from_text(cleaned_text))
+    if TTS_CACHE_ENABLED:
+        if out_path.is_file() and out_path.stat().st_size > 0:
+            CACHE_LOOKUPS.labels("tts_audio", "hit").inc()
+            media_store.touch(out_path)
+            _schedule_variants(cleaned_text, voice_name, stem)
+            if on_first_chunk is not None:
+                await _notify(on_first_chunk, str(out_path), url)
+            return str(out_path), url
+        CACHE_LOOKUPS.labels("tts_audio", "miss").inc()
 
-        # 音色選択
-        voice_name = _select_google_voice(voice)
-        voice_params = texttospeech.VoiceSelectionParams(
-            language_code="ja-JP",
-            name=voice_name,  # 例: "ja-JP-Neural2-C"
-        )
+    async def _synthesize() -> None:
+        nonlocal notified
+        chunks = _split_chunks(cleaned_text)
+        sem = asyncio.Semaphore(max(1, TTS_CHUNK_CONCURRENCY))
 
-        # MP3で出力
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0,     # 0.25〜4.0
-            pitch=0.0,             # -20.0〜20.0 semitones
-            volume_gain_db=0.0,    # -96.0〜16.0 dB
-        )
+        async def _chunk(i: int, chunk_text: str) -> bytes:
+            nonlocal notified
+            async with sem:
+                with span("google_tts"):
+                    audio = await to_thread.run_sync(_call_gcp_tts, chunk_text, voice_name)
+            if i == 0 and len(chunks) > 1 and on_first_chunk is not None:
+                await to_thread.run_sync(_write_atomic, first_path, audio)
+                notified = True
+                await _notify(on_first_chunk, str(first_path), first_url)
+            return audio
 
-        response = client.synthesize_speech(
-            input=input_,
-            voice=voice_params,
-            audio_config=audio_config,
-        )
-        return response.audio_content
+        # MP3 はフレームの連続なので、チャンクをそのまま順に繋げば1本として再生できる
+        parts = await asyncio.gather(*(_chunk(i, c) for i, c in enumerate(chunks)))
+        await to_thread.run_sync(_write_atomic, out_path, b"".join(parts))
 
     try:
-        audio_content = await to_thread.run_sync(_call_gcp_tts)
-        with open(out_path, "wb") as f:
-            f.write(audio_content)
+        if TTS_CACHE_ENABLED:
+            await _TTS_FLIGHT.do(digest, _synthesize)
+        else:
+            await _synthesize()
+        _schedule_variants(cleaned_text, voice_name, stem)
+        # 1チャンクのみ / 他の呼び出しの合成に相乗りした場合は完成版で通知
+        if on_first_chunk is not None and not notified:
+            await _notify(on_first_chunk, str(out_path), url)
         return str(out_path), url
 
     except Exception as e:
         # フォールバック：txt保存（既存挙動と同じ）
         print("TTS ERROR (GCP):", repr(e))
-        fallback = f"{uuid.uuid4()}.txt"
-        out_txt = GUIDE_DIR / fallback
-        url_txt = f"/media/guides/{fallback}"
+        out_txt, url_txt = media_store.guide_path(f"{uuid.uuid4().hex}.txt")
         try:
+            out_txt.parent.mkdir(parents=True, exist_ok=True)
             out_txt.write_text(text, encoding="utf-8")
+            media_store.record(out_txt)
         except Exception:
             pass
         return str(out_txt), url_txt
@@ -0,0 +1,105 @@
+# app/services/write_behind.py
+# レスポンスを返した後でゆっくりやればよい処理（説明文の生成→DB保存など）を
+# プロセス内のキューに積んで、バックグラウンドのワーカーで順に片付ける。
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Set
+
+# name → キュー（lifespan でまとめて start/stop する）
+_REGISTRY: Dict[str, "WriteBehindQueue"] = {}
+
+
+class WriteBehindQueue:
+    """
+    - submit() は待たずに戻る（満杯なら捨てる＝次の検索でまた積まれる）
+    - 同じ key が待機中/処理中なら二重に積まない
+    """
+
+    def __init__(self, name: str, workers: int = 2, maxsize: int = 500, drain_timeout: Optional[float] = 5.0):
+        self.name = name
+        self.workers = max(1, workers)
+        self.drain_timeout = drain_timeout  # stop_all() で積まれている分を待つ秒数
+        self._queue: "asyncio.Queue[tuple]" = asyncio.Queue(maxsize=max(1, maxsize))
+        self._pending: Set[Hashable] = set()
+        self._tasks: List[asyncio.Task] = []
+        self.done = 0
+        self.failed = 0
+        self.dropped = 0
+        _REGISTRY[name] = self
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def is_pending(self, key: Hashable) -> bool:
+        return key in self._pending
+
+    def full(self) -> bool:
+        return self._queue.full()
+
+    def submit(self, key: Hashable, fn: Callable[[], Awaitable[None]]) -> bool:
+        if key in self._pending:
+            return True
+        try:
+            self._queue.put_nowait((key, fn))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self._pending.add(key)
+        return True
+
+    async def _worker(self) -> None:
+        while True:
+            key, fn = await self._queue.get()
+            try:
+                await fn()
+                self.done += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failed += 1
+                print(f"[WRITE-BEHIND] {self.name} job failed key={key!r}: {e!r}")
+            finally:
+                self._pending.discard(key)
+                self._queue.task_done()
+
+    def start(self) -> None:
+        if self._tasks:
+            return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, drain_timeout: Optional[float] = 5.0) -> None:
+        """積まれている分を drain_timeout 秒だけ待ってからワーカーを止める"""
+        if not self._tasks:
+            return
+        if drain_timeout:
+            try:
+                await asyncio.wait_for(self._queue.join(), drain_timeout)
+            except asyncio.TimeoutError:
+                print(f"[WRITE-BEHIND] {self.name} stop: {self._queue.qsize()} jobs left undone")
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize(),
+            "pending": len(self._pending),
+            "done": self.done,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+
+async def start_all() -> None:
+    for q in _REGISTRY.values():
+        q.start()
+
+
+async def stop_all() -> None:
+    for q in _REGISTRY.values():
+        await q.stop(q.drain_timeout)
+
+
+def write_behind_stats() -> Dict[str, dict]:
+    return {name: q.stats() for name, q in _REGISTRY.items()}
@@ -0,0 +1,263 @@
+# bench/fake_providers.py
+# ベンチ用の外部API偽サーバ（Google Places / YOLP / Nominatim / Gemini / OpenAI / Google TTS）。
+# 1つの ASGI アプリに全プロバイダのパスを生やし、プロバイダごとに遅延を付けて返す。
+# 応答の中身はリポジトリ直下の resp.json（実際の /detour/search 応答）から作る。
+import asyncio
+import base64
+import hashlib
+import json
+import math
+import pathlib
+import random
+import time
+from typing import Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+SEED_FILE = pathlib.Path(__file__).resolve().parents[2] / "resp.json"
+
+# プロバイダ名 → 既定の応答遅延（秒）。実測のだいたいの中央値
+DEFAULT_LATENCY: Dict[str, float] = {
+    "google": 0.12,
+    "yolp": 0.15,
+    "nominatim": 0.10,
+    "gemini": 0.90,
+    "openai": 2.50,
+    "tts": 0.80,
+}
+
+_FALLBACK_SEEDS = [
+    {"name": "ベンチ食堂", "lat": 35.6595, "lng": 139.7005, "rating": 4.0, "open_now": True,
+     "url": "https://www.google.com/maps/place/?q=place_id:bench-0"},
+]
+
+
+class FakeConfig:
+    def __init__(
+        self,
+        latency: Optional[Dict[str, float]] = None,
+        jitter: float = 0.2,
+        results: int = 20,
+        audio_kb: int = 160,
+        seed_file: pathlib.Path = SEED_FILE,
+    ):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.jitter = max(0.0, jitter)       # 遅延の揺らぎ（±割合）
+        self.results = max(1, results)       # Nearby 1回あたりの件数
+        self.audio_kb = max(1, audio_kb)     # TTS の音声サイズ
+        self.seeds = load_seeds(seed_file)
+        self.calls: Dict[str, int] = {k: 0 for k in self.latency}
+
+
+def load_seeds(path: pathlib.Path) -> List[dict]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return list(_FALLBACK_SEEDS)
+    seeds = [x for x in data if isinstance(x, dict) and x.get("lat") is not None and x.get("lng") is not None]
+    return seeds or list(_FALLBACK_SEEDS)
+
+
+def _place_id(seed: dict, i: int) -> str:
+    url = seed.get("url") or ""
+    base = url.split("place_id:", 1)[1] if "place_id:" in url else hashlib.md5(seed["name"].encode()).hexdigest()
+    return f"{base}-{i}"
+
+
+def parse_latency(spec: Optional[str]) -> Dict[str, float]:
+    """'google=0.1,openai=1.5' → {"google": 0.1, "openai": 1.5}"""
+    out: Dict[str, float] = {}
+    for part in (spec or "").split(","):
+        if "=" not in part:
+            continue
+        k, v = part.split("=", 1)
+        k = k.strip()
+        if k not in DEFAULT_LATENCY:
+            raise ValueError(f"unknown provider in latency spec: {k}")
+        out[k] = float(v)
+    return out
+
+
+def create_app(config: FakeConfig) -> FastAPI:
+    app = FastAPI(title="SerendiGo bench fake providers")
+    rng = random.Random(0)
+
+    async def _delay(provider: str) -> None:
+        config.calls[provider] = config.calls.get(provider, 0) + 1
+        base = config.latency.get(provider, 0.0)
+        if base > 0:
+            await asyncio.sleep(base * (1 + rng.uniform(-config.jitter, config.jitter)))
+
+    def _nearby_results(lat: float, lng: float, radius_m: float, salt: str) -> List[dict]:
+        # シードの店を、問い合わせ位置を中心に半径内へ散らす（同じ問い合わせには同じ結果）
+        local = random.Random(f"{round(lat, 5)},{round(lng, 5)},{salt}")
+        out = []
+        for i in range(config.results):
+            seed = config.seeds[i % len(config.seeds)]
+            r_deg = (radius_m / 111_000.0) * math.sqrt(local.random()) * 0.9
+            theta = local.uniform(0, 2 * math.pi)
+            pid = _place_id(seed, i)
+            out.append({
+                "place_id": pid,
+                "name": seed["name"] if i < len(config.seeds) else f"{seed['name']} {i}",
+                "geometry": {"location": {
+                    "lat": lat + r_deg * math.sin(theta),
+                    "lng": lng + r_deg * math.cos(theta) / max(0.1, math.cos(math.radians(lat))),
+                }},
+                "rating": seed.get("rating"),
+                "opening_hours": {"open_now": bool(seed.get("open_now", True))},
+                "vicinity": "東京都渋谷区",
+                "types": [salt or "point_of_interest"],
+            })
+        return out
+
+    # ---- Google Places ----
+    @app.get("/maps/api/place/nearbysearch/json")
+    async def nearby(location: str, radius: float = 1000, type: Optional[str] = None, keyword: Optional[str] = None):
+        await _delay("google")
+        lat_s, lng_s = location.split(",", 1)
+        return {"status": "OK", "results": _nearby_results(float(lat_s), float(lng_s), radius, type or keyword or "")}
+
+    @app.get("/maps/api/place/details/json")
+    async def details(place_id: str):
+        await _delay("google")
+        seed = config.seeds[int(hashlib.md5(place_id.encode()).hexdigest(), 16) % len(config.seeds)]
+        return {"status": "OK", "result": {
+            "place_id": place_id,
+            "name": seed["name"],
+            "formatted_address": "日本、〒150-0042 東京都渋谷区宇田川町",
+            "geometry": {"location": {"lat": seed["lat"], "lng": seed["lng"]}},
+            "rating": seed.get("rating"),
+        }}
+
+    @app.get("/maps/api/place/autocomplete/json")
+    async def autocomplete(input: str):
+        await _delay("google")
+        return {"status": "OK", "predictions": [
+            {"place_id": _place_id(s, i), "description": s["name"]} for i, s in enumerate(config.seeds)
+        ]}
+
+    # ---- YOLP / Nominatim ----
+    @app.get("/search/local/V1/localSearch")
+    async def yolp(lat: float, lon: float, query: str = "", dist: float = 1.0, results: int = 50):
+        await _delay("yolp")
+        local = random.Random(f"{round(lat, 5)},{round(lon, 5)},{query}")
+        feats = []
+        for i in range(min(results, 10)):
+            d = dist / 111.0 * math.sqrt(local.random()) * 0.8
+            theta = local.uniform(0, 2 * math.pi)
+            feats.append({
+                "Id": f"yolp-{query}-{i}",
+                "Name": f"{query}ひろば {i}",
+                "Geometry": {"Coordinates": f"{lon + d * math.cos(theta)},{lat + d * math.sin(theta)}"},
+                "Property": {"Address": "東京都渋谷区", "Genre": [{"Name": "イベント"}], "CatchCopy": f"{query}開催中"},
+            })
+        return {"ResultInfo": {"Count": len(feats)}, "Feature": feats}
+
+    @app.get("/reverse")
+    async def reverse(lat: float, lon: float):
+        await _delay("nominatim")
+        return {"address": {"city": "渋谷区"}}
+
+    # ---- Gemini ----
+    @app.post("/v1beta/models/{model_action:path}")
+    async def gemini(model_action: str, request: Request):
+        await _delay("gemini")
+        body = {"short": "駅近で気軽に立ち寄れる人気のお店です。", "long": "ベンチ用の説明文です。" * 8}
+        return {
+            "candidates": [{"content": {"parts": [{"text": json.dumps(body, ensure_ascii=False)}]}}],
+            "usageMetadata": {"totalTokenCount": 180},
+        }
+
+    # ---- OpenAI ----
+    async def _chat_stream(model: str, text: str, include_usage: bool = False):
+        # 実際の API と同じく、最初のトークンまでが遅く、その後は細かく届く
+        step = 16
+        for i in range(0, len(text), step):
+            chunk = {
+                "id": "chatcmpl-bench-stream",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": text[i:i + step]}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0.01)
+        if include_usage:
+            usage = {
+                "id": "chatcmpl-bench-stream", "object": "chat.completion.chunk", "created": int(time.time()),
+                "model": model, "choices": [],
+                "usage": {"prompt_tokens": 420, "completion_tokens": 380, "total_tokens": 800},
+            }
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    @app.get("/v1/models/{model}")
+    async def openai_model(model: str):
+        return {"id": model, "object": "model", "created": 0, "owned_by": "bench"}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        payload = await request.json()
+        await _delay("openai")
+        text = "ここはベンチ用のガイド原稿です。見どころや歴史をやさしく紹介します。" * 8
+        if payload.get("stream"):
+            include_usage = bool((payload.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(_chat_stream(payload.get("model", "gpt-4o-mini"), text, include_usage),
+                                     media_type="text/event-stream")
+        return {
+            "id": f"chatcmpl-bench-{config.calls['openai']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "gpt-4o-mini"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": text}}],
+            "usage": {"prompt_tokens": 420, "completion_tokens": 380, "total_tokens": 800},
+        }
+
+    # ---- Google TTS（REST: v1/text:synthesize）----
+    audio = base64.b64encode(bytes(rng.getrandbits(8) for _ in range(config.audio_kb * 1024))).decode("ascii")
+
+    @app.post("/v1/text:synthesize")
+    async def synthesize(request: Request):
+        await request.body()
+        await _delay("tts")
+        return {"audioContent": audio}
+
+    @app.get("/v1/voices")
+    async def voices(languageCode: Optional[str] = None):
+        return {"voices": [{"name": "ja-JP-Neural2-C", "languageCodes": ["ja-JP"], "ssmlGender": "FEMALE"}]}
+
+    @app.get("/__calls")
+    async def calls():
+        return dict(config.calls)
+
+    return app
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    """単体起動: python -m bench.fake_providers --port 8765 --latency openai=1.0"""
+    import argparse
+
+    import uvicorn
+
+    ap = argparse.ArgumentParser(description="ベンチ用の外部API偽サーバ")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--latency", default="", help="provider=seconds,... (google/yolp/nominatim/gemini/openai/tts)")
+    ap.add_argument("--latency-scale", type=float, default=1.0, help="全プロバイダの遅延に掛ける倍率")
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--results", type=int, default=20, help="Nearby 1回あたりの件数")
+    ap.add_argument("--audio-kb", type=int, default=160)
+    ap.add_argument("--seed-file", type=pathlib.Path, default=SEED_FILE)
+    args = ap.parse_args(argv)
+
+    latency = {**DEFAULT_LATENCY, **parse_latency(args.latency)}
+    latency = {k: v * args.latency_scale for k, v in latency.items()}
+    config = FakeConfig(latency, args.jitter, args.results, args.audio_kb, args.seed_file)
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,399 @@
+# bench/run.py
+# 寄り道検索とガイド生成のオフラインベンチ。外部APIは bench/fake_providers.py の偽サーバ、
+# DB は一時ディレクトリの sqlite を使うので、ネットワークやクラウドの鍵なしで回せる。
+#
+# 使い方（backend/ で実行）:
+#     python -m bench.run                                   # 全シナリオ
+#     python -m bench.run --scenarios core,detour_search --requests 300 --concurrency 20
+#     python -m bench.run --out bench/results/baseline.json
+#     python -m bench.run --compare bench/results/baseline.json   # 悪化していたら終了コード 1
+import argparse
+import asyncio
+import contextlib
+import datetime as dt
+import io
+import itertools
+import json
+import math
+import os
+import pathlib
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from bench.fake_providers import SEED_FILE, load_seeds
+
+BENCH_DIR = pathlib.Path(__file__).resolve().parent
+BACKEND_DIR = BENCH_DIR.parent
+RESULTS_DIR = BENCH_DIR / "results"
+
+SCENARIOS = ["core", "detour_search", "detour_search_compat", "visits", "guides"]
+
+# 1リクエストごとに順番に切り替える（Google の type fan-out と YOLP の両方を通す）
+DETOUR_TYPES = ["food", "spot", "souvenir", "event"]
+COMPAT_CATEGORIES = ["gourmet", "local", "souvenir", "event"]
+
+
+# ---- 偽サーバと環境変数 ----
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_fake_server(args) -> tuple[subprocess.Popen, str]:
+    """偽サーバは別プロセスで起動する（同じプロセスだと GIL とイベントループを食い合って測定が歪む）"""
+    port = _free_port()
+    cmd = [
+        sys.executable, "-m", "bench.fake_providers",
+        "--port", str(port),
+        "--latency", args.latency,
+        "--latency-scale", str(args.latency_scale),
+        "--jitter", str(args.jitter),
+        "--results", str(args.results),
+    ]
+    proc = subprocess.Popen(cmd, cwd=BACKEND_DIR)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"fake provider server exited with {proc.returncode}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return proc, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("fake provider server did not start in 15s")
+
+
+def _configure_env(fake_url: str, workdir: pathlib.Path, args) -> None:
+    """app を import する前に呼ぶ（各モジュールは import 時に環境変数を読む）"""
+    (workdir / "media").mkdir(parents=True, exist_ok=True)
+    os.environ.update({
+        # 外部API → 偽サーバ
+        "GOOGLE_BASE_URL": fake_url,
+        "YOLP_BASE_URL": fake_url,
+        "GEMINI_BASE_URL": fake_url,
+        "NOMINATIM_BASE_URL": fake_url,
+        "OPENAI_BASE_URL": f"{fake_url}/v1",
+        "GOOGLE_TTS_ENDPOINT": fake_url,
+        "HTTP_CLIENT_HTTP2": "false",  # 偽サーバは HTTP/1.1
+        # 鍵はダミー（未設定だと各サービスが外部呼び出し自体をスキップする）
+        "GOOGLE_MAPS_API_KEY": "bench",
+        "YOLP_APP_ID": "bench",
+        "GEMINI_API_KEY": "bench",
+        "OPENAI_API_KEY": "bench",
+        # DB / 出力先
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir / 'bench.db'}",
+        "DB_CREATE_ALL": "true",  # 一時 DB なので起動時にテーブルを作る
+        "MEDIA_ROOT": str(workdir / "media"),
+        "TIMING_LOG": "false",
+    })
+
+
+# ---- 集計 ----
+def _percentile(sorted_values: List[float], p: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    idx = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[idx]
+
+
+def _summarize(latencies: List[float], errors: int, wall: float, concurrency: int, upstream: Dict[str, int]) -> dict:
+    lat = sorted(latencies)
+    ms = lambda v: round(v * 1000.0, 2) if v is not None else None  # noqa: E731
+    return {
+        "requests": len(lat) + errors,
+        "ok": len(lat),
+        "errors": errors,
+        "concurrency": concurrency,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(lat) / wall, 2) if wall > 0 else None,
+        "latency_ms": {
+            "mean": ms(sum(lat) / len(lat)) if lat else None,
+            "p50": ms(_percentile(lat, 50)),
+            "p95": ms(_percentile(lat, 95)),
+            "p99": ms(_percentile(lat, 99)),
+            "max": ms(lat[-1]) if lat else None,
+        },
+        # 偽サーバ側で数えた上流呼び出し回数（キャッシュ/single-flight の効き具合）
+        "upstream_calls": upstream,
+    }
+
+
+async def _run_load(op: Callable[[int], Awaitable[int]], requests: int, concurrency: int, offset: int):
+    latencies: List[float] = []
+    errors = 0
+    counter = itertools.count()
+
+    async def worker():
+        nonlocal errors
+        while True:
+            i = next(counter)
+            if i >= requests:
+                return
+            t0 = time.perf_counter()
+            try:
+                status = await op(offset + i)
+            except Exception as e:
+                errors += 1
+                print(f"[BENCH] request error: {e!r}", file=sys.stderr)
+                continue
+            if status >= 400:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(max(1, concurrency))))
+    return latencies, errors, time.perf_counter() - t0
+
+
+# ---- シナリオ ----
+async def _bench(args, fake_url: str) -> Dict[str, dict]:
+    sys.path.insert(0, str(BACKEND_DIR))
+    from fastapi import FastAPI
+
+    from app.main import app
+    from app.core.timing import TimingMiddleware
+    from app.db import models
+    from app.db.database import AsyncSessionLocal, SessionLocal
+    from app.routers import detour_adapter
+    from app.routes import guide_generation
+    from app.routes.detours import search_detours_core
+    from app.schemas.detour import DetourSearchQuery
+    from app.services import cache
+
+    def _side_app(*routers) -> FastAPI:
+        # main.py では routes/detours.py の /detour/search が先に登録されていて互換アダプタ側には届かない。
+        # /guides は main.py に未登録。どちらも同じミドルウェアを付けた別アプリで測る
+        side = FastAPI()
+        side.add_middleware(TimingMiddleware)
+        for r in routers:
+            side.include_router(r)
+        return side
+
+    rng = random.Random(args.seed)
+    seeds = load_seeds(SEED_FILE)  # 偽サーバと同じ resp.json の店を目的地にも使う
+    c_lat = sum(s["lat"] for s in seeds) / len(seeds)
+    c_lng = sum(s["lng"] for s in seeds) / len(seeds)
+    locations = [
+        (c_lat + rng.uniform(-args.spread, args.spread), c_lng + rng.uniform(-args.spread, args.spread))
+        for _ in range(max(1, args.locations))
+    ]
+
+    results: Dict[str, dict] = {}
+    async with app.router.lifespan_context(app):  # init_db / 共有クライアント / write-behind を本番と同じに起動
+        # LB が /ready を見てから流すのと同じく、ウォームアップ完了を待ってから計測する
+        from app.core import warmup
+        while not warmup.is_ready():
+            await asyncio.sleep(0.05)
+        # テストデータ（目的地とユーザー）
+        with SessionLocal() as db:
+            if db.get(models.User, 1) is None:
+                db.add(models.User(id=1, email="bench@example.com", hashed_password="x",
+                                   name="bench", gender="female", age_group="30s"))
+            dests = []
+            for i, s in enumerate(seeds):
+                place_id = f"bench-{i}"
+                d = db.query(models.Destination).filter_by(place_id=place_id).first()
+                if d is None:
+                    d = models.Destination(place_id=place_id, name=s["name"], address="東京都渋谷区",
+                                           lat=s["lat"], lng=s["lng"])
+                    db.add(d)
+                dests.append(d)
+            db.commit()
+            dest_ids = [(d.id, d.place_id) for d in dests]
+
+        main_client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=None)
+        compat_client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=_side_app(detour_adapter.router)), base_url="http://bench", timeout=None
+        )
+        guides_client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=_side_app(guide_generation.router)), base_url="http://bench", timeout=None
+        )
+        fake = httpx.AsyncClient(base_url=fake_url)
+
+        def _loc(i: int):
+            return locations[i % len(locations)]
+
+        async def op_core(i: int) -> int:
+            lat, lng = _loc(i)
+            q = DetourSearchQuery(lat=lat, lng=lng, minutes=15, mode="walk",
+                                  detour_type=DETOUR_TYPES[i % len(DETOUR_TYPES)], radius_m=None)
+            async with AsyncSessionLocal() as db:
+                await search_detours_core(q, db)
+            return 200
+
+        async def op_detour_search(i: int) -> int:
+            lat, lng = _loc(i)
+            r = await main_client.get("/detour/search", params={
+                "lat": lat, "lng": lng, "mode": "walk", "minutes": 15,
+                "detour_type": DETOUR_TYPES[i % len(DETOUR_TYPES)],
+            })
+            return r.status_code
+
+        async def op_detour_search_compat(i: int) -> int:
+            lat, lng = _loc(i)
+            r = await compat_client.get("/detour/search", params={
+                "lat": lat, "lng": lng, "mode": "walk", "duration": 15,
+                "category": COMPAT_CATEGORIES[i % len(COMPAT_CATEGORIES)],
+            })
+            return r.status_code
+
+        async def op_visits(i: int) -> int:
+            _, place_id = dest_ids[i % len(dest_ids)]
+            r = await main_client.post("/visits/", json={"destinationId": place_id, "userId": 1})
+            return r.status_code
+
+        async def op_guides(i: int) -> int:
+            dest_id, _ = dest_ids[i % len(dest_ids)]
+            r = await guides_client.post("/guides/", json={"destinationId": dest_id, "userId": "1"})
+            return r.status_code
+
+        ops = {
+            "core": op_core,
+            "detour_search": op_detour_search,
+            "detour_search_compat": op_detour_search_compat,
+            "visits": op_visits,
+            "guides": op_guides,
+        }
+        # ガイド生成は1件が秒単位なので件数を抑える
+        heavy = {"visits", "guides"}
+
+        try:
+            for name in args.scenarios:
+                if not args.warm_cache:
+                    cache.clear_all()
+                requests = args.guide_requests if name in heavy else args.requests
+                # アプリ側の print（GPT PROMPT など）で結果が埋もれないよう、計測中は stdout を捨てる
+                quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+                with quiet:
+                    await _run_load(ops[name], args.warmup, args.concurrency, offset=0)
+                    before = (await fake.get("/__calls")).json()
+                    latencies, errors, wall = await _run_load(
+                        ops[name], requests, args.concurrency, offset=args.warmup
+                    )
+                    after = (await fake.get("/__calls")).json()
+                upstream = {k: after.get(k, 0) - before.get(k, 0) for k in after if after.get(k, 0) - before.get(k, 0)}
+                results[name] = _summarize(latencies, errors, wall, args.concurrency, upstream)
+                _print_row(name, results[name])
+        finally:
+            for c in (main_client, compat_client, guides_client, fake):
+                await c.aclose()
+    return results
+
+
+# ---- 出力と比較 ----
+def _print_row(name: str, r: dict) -> None:
+    lm = r["latency_ms"]
+    print(
+        f"{name:<22} ok={r['ok']:<5} err={r['errors']:<3} rps={r['throughput_rps']!s:<8} "
+        f"p50={lm['p50']!s:<9} p95={lm['p95']!s:<9} p99={lm['p99']!s:<9} upstream={r['upstream_calls']}",
+        flush=True,
+    )
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                             capture_output=True, text=True, timeout=5)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def _compare(baseline: dict, current: dict, threshold: float) -> List[str]:
+    """p95 が threshold% 以上遅い / スループットが threshold% 以上落ちたシナリオを返す"""
+    regressions: List[str] = []
+    print(f"\n--- compare with baseline ({baseline.get('meta', {}).get('git_commit')}) ---")
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        parts = []
+        for key in ("p50", "p95", "p99"):
+            b, c = base["latency_ms"].get(key), cur["latency_ms"].get(key)
+            if b and c is not None:
+                parts.append(f"{key} {b}→{c}ms ({(c - b) / b * 100:+.1f}%)")
+        b_rps, c_rps = base.get("throughput_rps"), cur.get("throughput_rps")
+        if b_rps and c_rps is not None:
+            parts.append(f"rps {b_rps}→{c_rps} ({(c_rps - b_rps) / b_rps * 100:+.1f}%)")
+        print(f"{name:<22} " + "  ".join(parts))
+
+        b95, c95 = base["latency_ms"].get("p95"), cur["latency_ms"].get("p95")
+        if (b95 and c95 is not None and c95 > b95 * (1 + threshold / 100.0)) or (
+            b_rps and c_rps is not None and c_rps < b_rps * (1 - threshold / 100.0)
+        ):
+            regressions.append(name)
+    if regressions:
+        print(f"REGRESSION (>{threshold:.0f}%): {', '.join(regressions)}")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="寄り道検索・ガイド生成のオフラインベンチ")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"カンマ区切り: {','.join(SCENARIOS)}")
+    ap.add_argument("--requests", type=int, default=200, help="検索系シナリオの計測リクエスト数")
+    ap.add_argument("--guide-requests", type=int, default=40, help="visits / guides の計測リクエスト数")
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--warmup", type=int, default=5)
+    ap.add_argument("--locations", type=int, default=50, help="検索地点の数（多いほどキャッシュが効きにくい）")
+    ap.add_argument("--spread", type=float, default=0.02, help="検索地点を散らす幅（度）")
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--warm-cache", action="store_true", help="シナリオ間でプロセス内キャッシュを消さない")
+    ap.add_argument("--latency", default="", help="偽サーバの遅延 provider=seconds,...")
+    ap.add_argument("--latency-scale", type=float, default=1.0)
+    ap.add_argument("--jitter", type=float, default=0.2)
+    ap.add_argument("--results", type=int, default=20, help="Nearby 1回あたりの件数")
+    ap.add_argument("--database-url", default=None, help="既定は一時ディレクトリの sqlite")
+    ap.add_argument("--out", type=pathlib.Path, default=None, help="結果JSONの保存先（既定 bench/results/<時刻>.json）")
+    ap.add_argument("--compare", type=pathlib.Path, default=None, help="比較するベースラインJSON")
+    ap.add_argument("--threshold", type=float, default=10.0, help="悪化とみなす割合（%%）")
+    ap.add_argument("--verbose", action="store_true", help="アプリ側の print を抑制しない")
+    args = ap.parse_args(argv)
+
+    args.scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    proc, fake_url = _start_fake_server(args)
+    try:
+        with tempfile.TemporaryDirectory(prefix="serendigo-bench-") as tmp:
+            _configure_env(fake_url, pathlib.Path(tmp), args)
+            scenarios = asyncio.run(_bench(args, fake_url))
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+
+    report = {
+        "meta": {
+            "timestamp": dt.datetime.now().isoformat(timespec="seconds"),
+            "git_commit": _git_commit(),
+            "python": platform.python_version(),
+            "args": {k: (str(v) if isinstance(v, pathlib.Path) else v) for k, v in vars(args).items()},
+        },
+        "scenarios": scenarios,
+    }
+    out = args.out or RESULTS_DIR / f"{dt.datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\nsaved: {out}")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        if _compare(baseline, report, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())